@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from PIL import Image
+
+from epaper_display import EpaperDisplay
+from simulated import RefreshModel, SimulatedPanel
+
+# Benchmarks for the render, pack and transfer path using the simulated panel, so they run anywhere.
+# Results are printed as json, save them from two versions and compare to spot regressions:
+#   python bench.py --runs 20 --output bench.json
+
+# Canned aviationweather.gov responses so weather renders don't depend on the network
+SAMPLE_METAR_JSON = [{"icaoId": "KSFO", "obsTime": 1760723760, "rawOb": "KSFO 171756Z 29012G20KT 10SM FEW008 BKN200 18/12 A3001",
+                      "temp": 18, "dewp": 12, "wdir": 290, "wspd": 12, "wgst": 20, "visib": "10+", "altim": 1016.2}]
+
+# Run function a number of times and summarise how long it took in seconds
+def measure(function, runs, setup=None):
+    times = []
+    try:
+        for _ in range(runs):
+            if setup: setup()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+    return {
+        "runs": runs,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "max": max(times),
+    }
+
+# Make a phone sized jpeg once so image ingest has something realistic to decode
+def sample_upload(size=(4032, 3024)):
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+# Short git revision of the tree being benchmarked
+def version():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Cold start in a fresh interpreter the way main.main starts: import main, set up the display and get
+# the first clock frame out. Prints seconds for each step as json
+FIRST_FRAME_SCRIPT = """
+import json, os, resource, sys, tempfile, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from epaper_display import EpaperDisplay
+from simulated import RefreshModel, SimulatedPanel
+display = EpaperDisplay(backend=SimulatedPanel(refresh_model=RefreshModel(scale=float(sys.argv[1]))))
+display.initalize_display()
+ready = time.perf_counter()
+main.SNAPSHOT_PATH = os.path.join(tempfile.mkdtemp(), "snapshot.bin")
+panel = main.add_panel("main", display)
+panel.layout = "clock"
+main.update_display(panel)
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "initialize": ready - imported, "first_frame": done - ready, "total": done - start,
+                  "modules": len(sys.modules), "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+# Run the cold start script in new interpreters and take the median of every step
+def cold_start(runs, refresh_scale):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", FIRST_FRAME_SCRIPT, str(refresh_scale)],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)), text=True, stderr=subprocess.DEVNULL)
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+def run_benchmarks(runs, refresh_scale):
+    results = {}
+    try:
+        results["startup.cold"] = dict(cold_start(runs, refresh_scale), runs=runs)
+    except (OSError, subprocess.CalledProcessError, ValueError) as error:
+        results["startup.cold"] = {"error": f"{type(error).__name__}: {error}"}
+
+    panel = SimulatedPanel(refresh_model=RefreshModel(scale=refresh_scale))
+    display = EpaperDisplay(backend=panel)
+    display.initalize_display()
+
+    # Layout renders
+    from modules.clock import main as clock
+    results["clock.render"] = measure(clock.render, runs)
+    try:
+        from modules.clock import main2 as clock2
+        results["clock2.render"] = measure(clock2.render, runs)
+    except Exception as error:
+        results["clock2.render"] = {"error": f"{type(error).__name__}: {error}"}
+
+    from modules.weather import main as weather
+    weather.service.background = False
+    weather.service.put("KSFO", SAMPLE_METAR_JSON)
+    weather.location_data.update({"latitude": 37.62, "longitude": -122.38, "city": "San Francisco", "region": "California",
+                                  "airport": {"icao_code": "KSFO"}, "airport_distance": 0.0})
+    def reset_weather(): weather._cache_img = None
+    results["weather.render"] = measure(lambda: weather.render(), runs, setup=reset_weather)
+    try:
+        from modules.weather import main2 as weather2
+        weather2.service.background = False
+        weather2.service.put("KSFO", SAMPLE_METAR_JSON)
+        def reset_weather2(): weather2._station_image = (None, None)
+        results["weather2.render"] = measure(lambda: weather2.render(), runs, setup=reset_weather2)
+    except Exception as error:
+        results["weather2.render"] = {"error": f"{type(error).__name__}: {error}"}
+
+    # Image ingest, the same work the upload handler does
+    from modules.image_display import main as image
+    from ingest import ingest_image
+    upload = sample_upload()
+    results["image.ingest"] = measure(lambda: image.set_image(ingest_image(upload)), runs)
+    results["image.ingest"]["upload_bytes"] = len(upload)
+
+    # Packing a full photo into a frame
+    photo = Image.open(io.BytesIO(upload))
+    photo.load()
+    results["framebuffer.pack"] = measure(lambda: display.pack_image(photo, 128), runs)
+
+    # Dithering a panel sized upload
+    panel_photo = ingest_image(upload)
+    for mode in ("bayer8", "floyd-steinberg", "atkinson"):
+        results[f"dither.{mode}"] = measure(lambda: display.pack_image(panel_photo, 128, dither=mode), runs)
+
+    # SPI transfer of a whole frame and of a small partial update, with counters for one transfer
+    frame = display.pack_image(photo, 128)
+    panel.reset_counters()
+    results["spi.full_frame"] = measure(lambda: display.full_refresh(frame), runs)
+    results["spi.full_frame"].update({key: value / runs for key, value in panel.stats().items()})
+
+    changed = bytearray(frame)
+    changed[100:104] = bytes(byte ^ 0xFF for byte in frame[100:104])
+    frames = [bytes(changed), frame]
+    def partial_update():
+        display.updates_since_clean = 0
+        display.display_frame(frames[0])
+        frames.reverse()
+    panel.reset_counters()
+    results["spi.partial_update"] = measure(partial_update, runs)
+    results["spi.partial_update"].update({key: value / runs for key, value in panel.stats().items()})
+
+    # Deep sleep and the wake for the next update, then a clock sized update straight after waking
+    from power import PowerManager
+    power = PowerManager(display)
+    results["power.sleep"] = measure(power.sleep, runs, setup=power.wake)
+    results["power.wake"] = measure(power.wake, runs, setup=power.sleep)
+    def wake_and_update():
+        power.wake()
+        partial_update()
+    results["power.wake_to_update"] = measure(wake_and_update, runs, setup=power.sleep)
+
+    # HTTP upload through to the display finishing its refresh
+    import main
+    state_directory = tempfile.mkdtemp()
+    main.SNAPSHOT_PATH = os.path.join(state_directory, "snapshot.bin")
+    main.LIBRARY_PATH = os.path.join(state_directory, "library")
+    panel = main.add_panel("bench", display)
+    client = main.create_app().test_client()
+    def upload_and_refresh():
+        response = client.post("/display_image", data={"image": (io.BytesIO(upload), "photo.jpg"), "threshold": "128"},
+                               content_type="multipart/form-data")
+        assert response.status_code == 202, response.status_code
+        # New uploads are posted to the panel once ingest has decoded them
+        panel.scheduler.wait(time.time() + 60)
+        main.update_display(panel)
+        display.wait_busy()
+        assert main.jobs.get(response.json["id"]).state == "done"
+    # Forget the last frame so every upload goes all the way to a full refresh
+    def forget_frame():
+        main.frames.reset_shown(panel.name)
+        display.last_frame = None
+    results["http.upload_to_refresh"] = measure(upload_and_refresh, runs, setup=forget_frame)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the e-paper render, pack and transfer path")
+    parser.add_argument("--runs", type=int, default=10, help="times to run each benchmark")
+    parser.add_argument("--refresh-scale", type=float, default=0.0, help="scale for simulated panel busy times, 0 skips them")
+    parser.add_argument("--output", help="file to write json results to, defaults to stdout")
+    parser.add_argument("--trace", help="file to write a Chrome trace of the last refreshes to")
+    args = parser.parse_args()
+
+    report = {
+        "version": version(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "runs": args.runs,
+        "refresh_scale": args.refresh_scale,
+    }
+    # Modules print while they render, keep stdout for the json results
+    with contextlib.redirect_stdout(sys.stderr):
+        report["results"] = run_benchmarks(args.runs, args.refresh_scale)
+    if args.trace:
+        from metrics import metrics
+        metrics.dump_trace(args.trace, refreshes=args.runs)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file: file.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    sys.exit(main())
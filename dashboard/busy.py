@@ -0,0 +1,24 @@
+import time
+
+# Waiting on the display's BUSY pin. The pin is high while the display is working, instead of
+# polling it this sleeps on the falling edge so the wait ends as soon as the display is ready.
+
+# Longest single edge wait, the pin level is checked again after each one in case an edge was
+# missed between reading the pin and starting the wait
+EDGE_WAIT_SLICE = 1.0
+
+# Raised when the display stays busy longer than the timeout
+class BusyTimeoutError(TimeoutError):
+    pass
+
+# Wait until BUSY goes low, returns how many seconds the display was busy for
+def wait_for_ready(GPIO, pin, timeout=None):
+    start = time.monotonic()
+    while GPIO.input(pin) == 1:
+        remaining = EDGE_WAIT_SLICE
+        if timeout is not None:
+            remaining = min(remaining, timeout - (time.monotonic() - start))
+            if remaining <= 0:
+                raise BusyTimeoutError(f"Display still busy after {timeout} seconds")
+        GPIO.wait_for_edge(pin, GPIO.FALLING, timeout=max(1, int(remaining * 1000)))
+    return time.monotonic() - start
@@ -0,0 +1,92 @@
+from PIL import Image
+import numpy as np
+
+from framebuffer import DITHER_MODES
+
+# Dithers grayscale images down to black and white with NumPy. The same algorithms and integer
+# arithmetic run in the upload page's live preview (templates/index.html), but the browser scales the
+# image with its own smoothing and offsets, not PIL's, so that preview is only approximate. Once the
+# upload is in, the page shows /preview, which is the frame the panel gets.
+#
+# threshold sets how dark the image comes out, like the hard threshold in framebuffer.pack_image:
+# a gray value at or below 255 - threshold is black.
+#   threshold        - plain threshold, no dithering
+#   bayer2/4/8       - ordered dithering, the Bayer pattern fades out towards the slider's ends
+#   floyd-steinberg  - error diffusion spreading all of the error
+#   atkinson         - error diffusion spreading 3/4 of the error, higher contrast
+
+# Error diffusion weights as (dx, dy, weight) with the error shifted right by the shift
+FLOYD_STEINBERG = ((1, 0, 7), (-1, 1, 3), (0, 1, 5), (1, 1, 1)), 4
+ATKINSON = ((1, 0, 1), (2, 0, 1), (-1, 1, 1), (0, 1, 1), (1, 1, 1), (0, 2, 1)), 3
+
+# Bayer index matrix of size n, built up from 2x2 blocks
+def bayer_matrix(n):
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < n:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return matrix
+
+# Dither image to a black (0) and white (255) "L" image, resized to size first when one is given
+def dither_image(img, mode="floyd-steinberg", threshold=128, size=None):
+    if mode not in DITHER_MODES: raise ValueError(f"Unknown dither mode {mode}")
+    img = img.convert("L")
+    if size is not None and img.size != size: img = img.resize(size)
+    gray = np.asarray(img, dtype=np.int32)
+    level = 255 - threshold
+
+    if mode == "threshold": black = gray <= level
+    elif mode.startswith("bayer"): black = ordered_dither(gray, int(mode[5:]), level)
+    elif mode == "atkinson": black = error_diffusion(gray, level, *ATKINSON)
+    else: black = error_diffusion(gray, level, *FLOYD_STEINBERG)
+    return Image.fromarray(np.where(black, 0, 255).astype(np.uint8), "L")
+
+# Ordered dithering. The pattern is centred on the level and shrinks to nothing as the level gets to
+# pure black or white, so the ends of the slider still give solid images
+def ordered_dither(gray, n, level):
+    height, width = gray.shape
+    pattern = (bayer_matrix(n) / (n * n - 1)) * 255
+    fade = min(level, 255 - level) / 127.5
+    limit = level + (pattern - 127.5) * fade
+    limit = np.tile(limit, (height // n + 1, width // n + 1))[:height, :width]
+    return gray < limit
+
+# Error diffusion with integer errors. Each pixel only depends on pixels to its left, the row above up
+# to one pixel right and rows further up, so every pixel on the line x + 2y = t can be done at once.
+# That turns 384000 single pixel steps into 1760 vectorized ones for an 800x480 image
+def error_diffusion(gray, level, weights, shift):
+    height, width = gray.shape
+    pad_left, pad_right, pad_bottom = 1, 2, 2       # Room for errors pushed off the image edges
+    stride = width + pad_left + pad_right
+    work = np.zeros((height + pad_bottom) * stride, dtype=np.int32)
+    work.reshape(-1, stride)[:height, pad_left:pad_left + width] = gray
+    black = np.zeros(height * width, dtype=bool)
+    offsets = [(dy * stride + dx, weight) for dx, dy, weight in weights]
+
+    rows = np.arange(height)
+    for t in range(width + 2 * (height - 1)):
+        first = max(0, (t - width + 2) // 2)
+        last = min(height - 1, t // 2)
+        ys = rows[first:last + 1]
+        xs = t - 2 * ys
+        index = ys * stride + xs + pad_left
+        value = work[index]
+        is_black = value <= level
+        error = value - np.where(is_black, 0, 255)
+        for offset, weight in offsets:
+            work[index + offset] += (error * weight) >> shift
+        black[ys * width + xs] = is_black
+    return black.reshape(height, width)
+
+# Pixel by pixel error diffusion in plain python, kept to check the vectorized version against
+def error_diffusion_reference(gray, level, weights, shift):
+    height, width = gray.shape
+    work = [[int(value) for value in row] + [0, 0] for row in gray] + [[0] * (width + 2) for _ in range(2)]
+    black = np.zeros((height, width), dtype=bool)
+    for y in range(height):
+        for x in range(width):
+            value = work[y][x]
+            black[y, x] = value <= level
+            error = value - (0 if black[y, x] else 255)
+            for dx, dy, weight in weights:
+                if x + dx >= 0: work[y + dy][x + dx] += (error * weight) >> shift
+    return black
@@ -1,107 +1,247 @@
-import spidev
-import RPi.GPIO as GPIO
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import time
-from PIL import ImageOps
+
+from busy import BusyTimeoutError, wait_for_ready
+from framebuffer import crop_frame, diff_regions, merge_regions, pack_image
+from hardware import load_backend
+from metrics import metrics
+from refresh_policy import RefreshPolicy
+from transport import SpiTransport, open_spi
+
+# Seconds the reset pin is held low, and then left before BUSY is read. The controller only needs
+# microseconds, after that the wait on BUSY ends as soon as it is ready
+RESET_PULSE = 0.002
 
 # Epaper display class for displaying data to the display
-class EpaperDisplay(): 
-    def __init__(self):
+# Pins and SPI device default to a single panel HAT, each panel on a Pi needs its own device and pins
+class EpaperDisplay():
+    def __init__(self, spi_speed_hz=2_000_000, partial_fraction=0.25, max_partial_updates=10, backend=None, busy_timeout=30,
+                 bus=0, device=0, dc_pin=25, busy_pin=24, rst_pin=17, name="main", policy=None, max_partial_windows=1):
+        self.name = name            # Panel name used to label metrics
         # Screen size
         self.width=800
-        self.height=480   
-        self.buffer_length = self.width * self.height // 8   # screen buffer size 
+        self.height=480
+        self.buffer_length = self.width * self.height // 8   # screen buffer size
         self.color_white=0x00
         self.color_black=0xFF
 
+        # Hardware to talk to the display with, a real Raspberry Pi unless another backend is given
+        self.backend = backend or load_backend()
+        self.GPIO = self.backend.GPIO
+
         # Startup display
-        self.spi = spidev.SpiDev()           # Setup spi class
-        self.spi.open(0, 0)                  # Set spi modes
-        self.spi.max_speed_hz = 2_000_000    # Set max spi pin speed
-        self.spi.mode = 0b00                 # Set clock mode
+        self.spi = open_spi(self.backend.spidev, bus, device, spi_speed_hz)  # Setup spi class with mode 0 at the requested clock
 
         # Setup used pi pins and initalize them
-        self.DC_pin=25
-        self.BUSY_pin=24
-        self.RST_pin=17
-        GPIO.setmode(GPIO.BCM)      
-        GPIO.setup(self.DC_pin, GPIO.OUT)   
-        GPIO.setup(self.RST_pin, GPIO.OUT)   
-        GPIO.setup(self.BUSY_pin, GPIO.IN)     
-    
+        self.DC_pin=dc_pin
+        self.BUSY_pin=busy_pin
+        self.RST_pin=rst_pin
+        self.GPIO.setmode(self.GPIO.BCM)
+        self.GPIO.setup(self.DC_pin, self.GPIO.OUT)
+        self.GPIO.setup(self.RST_pin, self.GPIO.OUT)
+        self.GPIO.setup(self.BUSY_pin, self.GPIO.IN)
+
+        # Transport sends each command and its data payload in bulk
+        self.transport = SpiTransport(self.spi, self.GPIO, self.DC_pin)
+
+        # Refresh settings for frames sent without a policy of their own, by default a clean full refresh
+        # is done when more than partial_fraction of the screen changes or after max_partial_updates
+        # partial refreshes in a row to clear ghosting, see refresh_policy.py
+        self.policy = policy or RefreshPolicy(max_updates=max_partial_updates, max_fraction=partial_fraction)
+        self.updates_since_clean = 0            # Partial and fast refreshes since the last clean full refresh
+        self.last_clean = time.monotonic()      # When the last clean full refresh finished
+        self.fast_waveform = False              # True while the fast waveform is selected
+        self.last_frame = None      # Last frame sent to the display, None when unknown
+        self.max_partial_windows = max_partial_windows  # Partial windows per update, each one is a refresh of its own
+
+        # Busy wait settings, the display is reset if it stays busy longer than busy_timeout seconds
+        self.busy_timeout = busy_timeout
+        self.busy_times = deque(maxlen=100)     # How long each recent busy period lasted in seconds
+        self.busy_executor = None               # Thread used by wait_busy_async
+        self.recovering = False
+        self.sleeping = False       # True while the controller is in deep sleep
+        self.progress = None        # Called with "transferring" and "refreshing" while display_frame runs
+
     # Send data array to the display
     def data(self, data):
-        GPIO.output(self.DC_pin, GPIO.HIGH)
-        self.spi.writebytes([data])
+        self.transport.data([data])
 
-    # Send command to the display to proform diffrent operations
-    def cmd(self, data):
-        GPIO.output(self.DC_pin, GPIO.LOW)
-        self.spi.writebytes([data])
+    # Send command to the display to proform diffrent operations, with an optional data payload
+    def cmd(self, data, payload=None):
+        self.transport.command(data, payload)
 
-    # Wait until display is able to reacive data
+    # Wait until display is able to reacive data, returns how long the display was busy.
+    # If the display never becomes ready it gets reset and BusyTimeoutError is raised
     def wait_busy(self):
-        while GPIO.input(self.BUSY_pin) == 1: time.sleep(0.05)
+        try:
+            busy_time = wait_for_ready(self.GPIO, self.BUSY_pin, self.busy_timeout)
+        except BusyTimeoutError:
+            if not self.recovering: self.recover()
+            raise
+        self.busy_times.append(busy_time)
+        metrics.observe("busy", busy_time, panel=self.name)
+        return busy_time
+
+    # Wait for the display in a background thread so other work can carry on, returns a future
+    # which resolves to the busy time. Use asyncio.wrap_future to await it from async code
+    def wait_busy_async(self):
+        if self.busy_executor is None: self.busy_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="epaper-busy")
+        return self.busy_executor.submit(self.wait_busy)
+
+    # Reset and initalize display again after it stopped responding
+    def recover(self):
+        self.recovering = True
+        try:
+            self.initalize_display()
+        except BusyTimeoutError:
+            pass                    # Still not responding, next refresh will try again
+        finally:
+            self.recovering = False
+
+    # Hardware reset, waits on BUSY for the controller to come back instead of a fixed delay
+    def reset(self):
+        self.GPIO.output(self.RST_pin, self.GPIO.LOW)
+        time.sleep(RESET_PULSE)
+        self.GPIO.output(self.RST_pin, self.GPIO.HIGH)
+        time.sleep(RESET_PULSE)
+        self.wait_busy()
+        self.sleeping = False
 
     # Initalize display for new usage
     def initalize_display(self):
         # Reset display for new use
-        GPIO.output(self.RST_pin, GPIO.LOW)
-        time.sleep(0.2)
-        GPIO.output(self.RST_pin, GPIO.HIGH)
-        time.sleep(0.2)
+        self.reset()
 
         # Configure display settings
-        self.cmd(0x01) 
-        self.data(0x07)
-        self.data(0x07)
-        self.data(0x3F)
-        self.data(0x3F)
-        self.cmd(0x04)
+        self.cmd(0x01, [0x07, 0x07, 0x3F, 0x3F])    # Power settings
+        self.cmd(0x04)                              # Power on
         self.wait_busy()
-        self.cmd(0x00) 
-        self.data(0x1F)
-        self.cmd(0x61) 
-        self.data(0x03)
-        self.data(0x20)
-        self.data(0x01)
-        self.data(0xE0)
-        self.cmd(0x15) 
-        self.data(self.color_white)
-    
+        self.cmd(0x00, [0x1F])                      # Panel settings
+        self.cmd(0x61, [0x03, 0x20, 0x01, 0xE0])    # Resolution 800x480
+        self.cmd(0x15, [self.color_white])
+        self.last_frame = None
+        self.updates_since_clean = 0
+        self.fast_waveform = False                  # Reset puts the panel back on its own waveform
+
     # Clear display by changing it to white
     def clear_display(self):
-        self.cmd(0x13)
-        for i in range(self.buffer_length): # Set every pixel to white
-            self.data(self.color_white)
-        self.cmd(0x12)                      # send display refresh command
-        self.wait_busy()
+        self.full_refresh(bytes([self.color_white]) * self.buffer_length)  # Set every pixel to white
+
+    # Pack image into the panels frame buffer format, dithering it first unless dither is "threshold"
+    def pack_image(self, img, threshold=128, invert=False, dither="threshold"):
+        return pack_image(img, self.width, self.height, threshold, invert, self.color_black, self.color_white, dither)
 
     # Send image to display and then render whole image to display
-    def display_image(self, img, threshold):
-        img = img.convert("L").resize((self.width, self.height))
-        img=ImageOps.invert(img)
-        #self.clear_display()                                                   # Clear old images off display first
-        #img = img.convert("L").resize((self.width, self.height))                # Convert image to grayscale 
-        #img = img.point(lambda x: 0 if x < 128 else 255, "1")                   # Fit image to screen
-        pixels = img.load()                                                     # Load image data and write image data into bytes then send to screen to display image
-        self.cmd(0x13)
-        for y in range(self.height):
-            for x in range(0, self.width, 8):
-                byte = self.color_black
-                for bit in range(8):
-                    if x + bit >= self.width:
-                        continue
-                    if pixels[x + bit, y] < threshold:
-                        byte &= ~(1 << (7 - bit))
-                self.data(byte)
+    def display_image(self, img, threshold, invert=False, dither="threshold"):
+        return self.display_frame(self.pack_image(img, threshold, invert, dither))
+
+    # Send already packed frame buffer to display, only refreshing the parts that changed when the policy
+    # allows it. Returns "full", "fast", "partial" or None when the frame is already on the display.
+    # progress is called with "transferring" and then "refreshing" as the frame goes up
+    def display_frame(self, frame, policy=None, progress=None):
+        self.progress = progress
+        try:
+            self.report("transferring")
+            with metrics.timer("refresh", panel=self.name) as timer:
+                result = self.send_frame(frame, policy)
+                timer.labels["kind"] = result or "unchanged"
+        finally:
+            self.progress = None
+        return result
+
+    # Tell display_frame's caller what stage its frame is at
+    def report(self, stage):
+        if self.progress is not None: self.progress(stage)
+
+    # Pick refresh for a frame with the policy, the display's own one when none is given, and send it
+    def send_frame(self, frame, policy=None):
+        policy = policy or self.policy
+        if self.last_frame is None or policy.max_fraction <= 0:
+            self.full_refresh(frame)
+            return "full"
+
+        regions = diff_regions(self.last_frame, frame, self.width, self.height)
+        if not regions: return None
+
+        # The policy judges the windows that would actually refresh, not the scattered regions inside them
+        regions = merge_regions(regions, self.max_partial_windows)
+        dirty_area = sum(width * height for x, y, width, height in regions)
+        kind = policy.choose(dirty_area / (self.width * self.height), self.updates_since_clean, time.monotonic() - self.last_clean)
+        if kind == "full": self.full_refresh(frame)
+        elif kind == "fast": self.fast_refresh(frame)
+        else: self.partial_refresh(frame, regions, policy.fast)
+        return kind
+
+    # Switch between the panel's own waveform and the fast one. The fast waveform comes from fixing the
+    # temperature the controller picks its waveform by (cascade setting 0x02) at 90 degrees (0x5A),
+    # the same sequence as the 7.5" V2 driver's fast init
+    def set_fast_waveform(self, fast):
+        if fast == self.fast_waveform: return
+        if fast:
+            self.cmd(0xE0, [0x02])                  # Use the temperature below instead of the sensor
+            self.cmd(0xE5, [0x5A])
+        else:
+            self.cmd(0xE0, [0x00])                  # Back to the temperature sensor and the panel's waveform
+        self.fast_waveform = fast
+
+    # Send whole frame and refresh whole display with the panel's own waveform, clearing any ghosting
+    def full_refresh(self, frame):
+        self.set_fast_waveform(False)
+        self.cmd(0x13, frame)
+        self.report("refreshing")
+        self.cmd(0x12)
+        self.wait_busy()
+        self.last_frame = bytes(frame)
+        self.updates_since_clean = 0
+        self.last_clean = time.monotonic()
+
+    # Send whole frame and refresh whole display with the fast waveform
+    def fast_refresh(self, frame):
+        self.set_fast_waveform(True)
+        self.cmd(0x13, frame)
+        self.report("refreshing")
         self.cmd(0x12)
         self.wait_busy()
+        self.last_frame = bytes(frame)
+        self.updates_since_clean += 1
+
+    # Send changed regions using the partial window and refresh only those regions, with the fast waveform when fast is set.
+    # Every window flashes the panel and waits on BUSY, so send_frame merges regions down to max_partial_windows first,
+    # the unchanged pixels a merged window takes in have the same old and new data and don't change
+    def partial_refresh(self, frame, regions, fast=False):
+        self.set_fast_waveform(fast)
+        self.cmd(0x91)                                              # Enter partial mode
+        for region in regions:
+            x, y, width, height = region
+            x_end, y_end = x + width - 1, y + height - 1
+            self.cmd(0x90, [x >> 8, x & 0xF8, x_end >> 8, (x_end & 0xFF) | 0x07, y >> 8, y & 0xFF, y_end >> 8, y_end & 0xFF, 0x01])
+            self.cmd(0x10, crop_frame(self.last_frame, self.width, region))  # Old data for the region
+            self.cmd(0x13, crop_frame(frame, self.width, region))            # New data for the region
+            self.report("refreshing")
+            self.cmd(0x12)
+            self.wait_busy()
+        self.cmd(0x92)                                              # Leave partial mode
+        self.last_frame = bytes(frame)
+        self.updates_since_clean += 1
+
+    # Power off and put the controller into deep sleep, SPI and GPIO stay open so wake is only a reset and init.
+    # The panel keeps showing its image while the controller sleeps
+    def sleep(self):
+        self.cmd(0x02)                              # Power off
+        self.wait_busy()
+        self.cmd(0x07, [0xA5])                      # Deep sleep, 0xA5 is the check code
+        self.sleeping = True
+
+    # Bring the controller back from deep sleep. The panel still shows the last frame, so it is kept for
+    # partial refreshes along with the count of updates since the last clean refresh
+    def wake(self):
+        last_frame, updates_since_clean = self.last_frame, self.updates_since_clean
+        self.initalize_display()
+        self.last_frame, self.updates_since_clean = last_frame, updates_since_clean
 
     # Shutdown down display when it's no longer being used
     def shutdown_display(self):
-        self.cmd(0x02)
-        self.wait_busy()
-        self.cmd(0x07)
-        self.data(0xA5)
+        if not self.sleeping: self.sleep()
         self.spi.close()
-        GPIO.cleanup()
\ No newline at end of file
+        self.GPIO.cleanup([self.DC_pin, self.RST_pin, self.BUSY_pin])     # Only this panel's pins, others may still be running
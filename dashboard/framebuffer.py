@@ -0,0 +1,124 @@
+from PIL import Image
+
+# Packs PIL images into the panel's 1 bit per pixel frame buffer. Each byte holds 8 horizontal
+# pixels with the left most pixel in the highest bit, rows are sent top to bottom.
+#
+# A pixel is black when its inverted gray value is at or above the threshold which is the same
+# rule EpaperDisplay used when it packed frames one pixel at a time.
+
+# Ways pack_image can turn gray into black and white, every mode but "threshold" is done by dither.py
+DITHER_MODES = ("threshold", "bayer2", "bayer4", "bayer8", "floyd-steinberg", "atkinson")
+
+# Build lookup table used by PIL to turn gray values into black (255) or white (0) bits
+def _threshold_table(threshold, invert):
+    table = []
+    for value in range(256):
+        black = (255 - value) >= threshold
+        if invert: black = not black
+        table.append(255 if black else 0)
+    return table
+
+# Table used to flip every bit in a buffer when the panel uses 0x00 for black
+_FLIP_TABLE = bytes(value ^ 0xFF for value in range(256))
+
+# Check settings are ones the panel can use
+def _check_frame(width, color_black, color_white):
+    if width % 8 != 0:
+        raise ValueError(f"Frame width must be a multiple of 8, got {width}")
+    if {color_black, color_white} != {0x00, 0xFF}:
+        raise ValueError("color_black and color_white must be 0x00 and 0xFF")
+
+# Convert image into packed frame buffer using PIL bulk operations, dithering it first unless dither is "threshold"
+def pack_image(img, width, height, threshold=128, invert=False, color_black=0xFF, color_white=0x00, dither="threshold"):
+    _check_frame(width, color_black, color_white)
+    if dither != "threshold":
+        from dither import dither_image     # NumPy is only imported once something is dithered
+        img = dither_image(img, dither, threshold, (width, height))
+        threshold = 128
+    img = img.convert("L")
+    if img.size != (width, height): img = img.resize((width, height))
+
+    # Mode "1" images are stored packed with the set bit meaning a black pixel here
+    frame = img.point(_threshold_table(threshold, invert), "1").tobytes()
+    if color_black == 0x00: frame = frame.translate(_FLIP_TABLE)
+    return frame
+
+# Pure python version of pack_image, kept as a reference to check the fast version against
+def pack_image_reference(img, width, height, threshold=128, invert=False, color_black=0xFF, color_white=0x00):
+    _check_frame(width, color_black, color_white)
+    img = img.convert("L")
+    if img.size != (width, height): img = img.resize((width, height))
+
+    pixels = img.load()
+    frame = bytearray()
+    for y in range(height):
+        for x in range(0, width, 8):
+            byte = color_white
+            for bit in range(8):
+                black = (255 - pixels[x + bit, y]) >= threshold
+                if invert: black = not black
+                if black == (color_black == 0xFF): byte |= 1 << (7 - bit)
+                else: byte &= ~(1 << (7 - bit))
+            frame.append(byte)
+    return bytes(frame)
+
+# Unpack frame buffer back into a 1 bit PIL image for previews
+def unpack_frame(frame, width, height, color_black=0xFF):
+    # PIL stores white as the set bit so panels using 0xFF for black need flipping
+    if color_black == 0xFF: frame = bytes(frame).translate(_FLIP_TABLE)
+    return Image.frombytes("1", (width, height), bytes(frame))
+
+# Find byte aligned rectangles that differ between two frames, returned as (x, y, width, height)
+# in pixels. Dirty rows closer together than merge_rows are merged into the same rectangle.
+def diff_regions(old, new, width, height, merge_rows=8):
+    stride = width // 8
+    regions = []
+    band = None     # [first row, last row, first byte, last byte] of the rectangle being built
+    for y in range(height):
+        start = y * stride
+        old_row = old[start:start + stride]
+        new_row = new[start:start + stride]
+        if old_row == new_row: continue
+
+        # Find first and last changed byte in the row
+        first = 0
+        while old_row[first] == new_row[first]: first += 1
+        last = stride - 1
+        while old_row[last] == new_row[last]: last -= 1
+
+        if band is not None and y - band[1] <= merge_rows:
+            band[1] = y
+            band[2] = min(band[2], first)
+            band[3] = max(band[3], last)
+        else:
+            if band is not None: regions.append(band)
+            band = [y, y, first, last]
+    if band is not None: regions.append(band)
+    return [(first * 8, top, (last - first + 1) * 8, bottom - top + 1) for top, bottom, first, last in regions]
+
+# Merge diff_regions rectangles until there are at most max_regions, each partial window costs the panel a
+# refresh of its own. The pair whose bounding box adds the least unchanged area is merged first
+def merge_regions(regions, max_regions=1):
+    regions = list(regions)
+    while len(regions) > max_regions:
+        best = None     # (added area, index, other index, bounding box)
+        for index in range(len(regions)):
+            for other in range(index + 1, len(regions)):
+                (x, y, width, height), (other_x, other_y, other_width, other_height) = regions[index], regions[other]
+                left, top = min(x, other_x), min(y, other_y)
+                right, bottom = max(x + width, other_x + other_width), max(y + height, other_y + other_height)
+                box = (left, top, right - left, bottom - top)
+                added = box[2] * box[3] - width * height - other_width * other_height
+                if best is None or added < best[0]: best = (added, index, other, box)
+        added, index, other, box = best
+        regions[index] = box
+        del regions[other]
+    return regions
+
+# Cut a rectangle from diff_regions out of a packed frame
+def crop_frame(frame, width, region):
+    x, y, region_width, region_height = region
+    stride = width // 8
+    first = x // 8
+    row_bytes = region_width // 8
+    return b"".join(frame[row * stride + first:row * stride + first + row_bytes] for row in range(y, y + region_height))
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+import hashlib
+import threading
+
+# Hash used to tell packed frames apart, much faster than comparing whole frames
+def frame_hash(frame):
+    return hashlib.blake2b(frame, digest_size=16).hexdigest()
+
+# Holds a bounded number of packed frames so frames that were already built don't need to be
+# rendered and packed again, and frames already on the display don't get sent again.
+# Frames are stored by hash, render keys describe what went into a frame e.g. (layout, threshold, inputs).
+# What is showing is kept per panel, panel is None when there is only one display
+class FrameStore():
+    def __init__(self, max_frames=16):
+        self.max_frames = max_frames
+        self.frames = OrderedDict()     # frame hash -> packed frame, oldest first
+        self.keys = {}                  # render key -> frame hash
+        self.shown = {}                 # panel -> (hash, frame) on its display, the frame is kept even after it drops out of the store
+        self.lock = threading.Lock()
+
+        # Counters for how much work the store saved
+        self.hits = 0       # render key found, render and pack skipped
+        self.misses = 0     # render key not found, frame had to be built
+        self.skips = 0      # frame was already on the display, refresh skipped
+
+    # Get frame built from a render key, or None if it needs building
+    def get(self, key):
+        with self.lock:
+            digest = self.keys.get(key)
+            if digest is None or digest not in self.frames:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.frames.move_to_end(digest)
+            return self.frames[digest]
+
+    # Store packed frame under its hash and optionally a render key, returns the hash
+    def put(self, frame, key=None):
+        digest = frame_hash(frame)
+        with self.lock:
+            self.frames[digest] = frame
+            self.frames.move_to_end(digest)
+            if key is not None: self.keys[key] = digest
+
+            # Drop oldest frames and any render keys still pointing at them
+            while len(self.frames) > self.max_frames:
+                old_digest, _ = self.frames.popitem(last=False)
+                self.keys = {k: v for k, v in self.keys.items() if v != old_digest}
+        return digest
+
+    # Mark frame as sent to a display, returns False when it is already showing so the refresh can be skipped
+    def show(self, frame, panel=None):
+        digest = frame_hash(frame)
+        with self.lock:
+            if panel in self.shown and self.shown[panel][0] == digest:
+                self.skips += 1
+                return False
+            self.shown[panel] = (digest, frame)
+            return True
+
+    # Forget what is on a display, e.g. after the display was cleared or reset
+    def reset_shown(self, panel=None):
+        with self.lock:
+            self.shown.pop(panel, None)
+
+    # Frame on a display, None when it isn't known
+    def showing(self, panel=None):
+        with self.lock:
+            shown = self.shown.get(panel)
+            return shown[1] if shown else None
+
+    # Counters and size of the store
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "skips": self.skips, "frames": len(self.frames)}
@@ -0,0 +1,17 @@
+from types import SimpleNamespace
+
+# Hardware backends give the display a spidev module and a GPIO module to talk to the panel with.
+#   rpi       - real spidev and RPi.GPIO, only importable on a Raspberry Pi
+#   simulated - fake panel that records everything sent to it, see simulated.py
+# Options only apply to the simulated backend, e.g. its pins, every rpi display shares the real modules.
+
+# Load backend by name, imports only happen here so nothing touches the hardware until a display is made
+def load_backend(name="rpi", **options):
+    if name == "rpi":
+        import spidev
+        import RPi.GPIO as GPIO
+        return SimpleNamespace(name="rpi", spidev=spidev, GPIO=GPIO)
+    if name == "simulated":
+        from simulated import SimulatedPanel
+        return SimulatedPanel(**options)
+    raise ValueError(f"Unknown hardware backend {name}")
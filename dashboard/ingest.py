@@ -0,0 +1,69 @@
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+import io
+import multiprocessing
+
+# Turns uploaded image files into panel sized grayscale images. JPEGs are decoded with draft mode
+# so the decoder scales them down while decoding, other formats are reduced before resizing, so a
+# 12 MP photo never exists at full size. Decoding runs in a separate process so it doesn't hold
+# the GIL the web server needs.
+
+PANEL_SIZE = (800, 480)
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024     # Largest upload accepted
+MAX_PIXELS = 50_000_000                 # Largest image accepted, stops decompression bombs
+FIT_MODES = ("contain", "cover", "stretch")
+
+# Raised for uploads that can't be used, the message is safe to show to the user
+class IngestError(ValueError):
+    pass
+
+# Decode image bytes into a panel sized grayscale image.
+#   contain - fit the whole image in the panel, padding the edges with white
+#   cover   - fill the whole panel, cropping the edges off
+#   stretch - resize to the panel ignoring aspect ratio
+def ingest_image(data, fit="contain", size=PANEL_SIZE, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_PIXELS):
+    if fit not in FIT_MODES: raise IngestError(f"Unknown fit mode {fit}")
+    if len(data) > max_bytes: raise IngestError(f"Image is larger than {max_bytes} bytes")
+    try:
+        img = Image.open(io.BytesIO(data))
+    except (OSError, Image.DecompressionBombError):
+        raise IngestError("Not a readable image")
+    if img.width * img.height > max_pixels: raise IngestError(f"Image has more than {max_pixels} pixels")
+
+    # Let the JPEG decoder scale down by up to 8x while still leaving at least panel size to work with
+    draft_size = size if fit != "cover" else cover_size(img.size, size)
+    img.draft("L", draft_size)
+    try:
+        img = ImageOps.exif_transpose(img)      # Phone photos are often stored sideways
+        img = img.convert("L")
+    except (OSError, SyntaxError) as error:
+        raise IngestError(f"Image could not be decoded: {error}")
+
+    # Shrink by a whole factor first, which is much cheaper than one big resample
+    img = reduce_to(img, draft_size)
+    if fit == "contain": return ImageOps.pad(img, size, color=255)
+    if fit == "cover": return ImageOps.fit(img, size)
+    return img.resize(size)
+
+# Reduce image by the largest whole factor that keeps it at least twice the target size,
+# so the final resample still has enough pixels to look smooth
+def reduce_to(img, size):
+    factor = min(img.width // (size[0] * 2), img.height // (size[1] * 2))
+    return img.reduce(factor) if factor > 1 else img
+
+# Smallest size with the image's aspect ratio that still covers the panel
+def cover_size(image_size, size):
+    scale = max(size[0] / image_size[0], size[1] / image_size[1])
+    return (max(1, round(image_size[0] * scale)), max(1, round(image_size[1] * scale)))
+
+# Process pool, started the first time an image is ingested. That happens on a web server thread, and forking
+# a process that already runs threads can copy a lock some other thread holds, so the worker is started
+# from a forkserver (a fresh interpreter on platforms without one) instead of forked from this process
+_pool = None
+POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Ingest image in the process pool, returns a future that resolves to the panel sized image
+def submit_ingest(data, fit="contain"):
+    global _pool
+    if _pool is None: _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+    return _pool.submit(ingest_image, data, fit)
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+
+from metrics import metrics
+
+# Display jobs started by web requests. A POST gets a job id straight away and the panel's display
+# thread and pipeline worker move the job through its states as the frame goes to the panel:
+#   queued        - waiting for the display thread, or for ingest to decode an upload
+#   rendering     - the layout is rendered and packed, uploads are decoded here too
+#   transferring  - the frame is going over SPI, including waking the panel
+#   refreshing    - the panel is refreshing
+#   done          - on the panel, result says how: "full", "fast", "partial" or "unchanged"
+#   cancelled     - a newer job for the same panel replaced it before its frame was sent
+#   failed        - the upload couldn't be decoded or the panel stopped responding
+# Every state change is published to /events subscribers as Server-Sent Events.
+
+STATES = ("queued", "rendering", "transferring", "refreshing", "done", "cancelled", "failed")
+FINAL_STATES = ("done", "cancelled", "failed")
+MAX_JOBS = 256          # Jobs remembered for /jobs/<id>, oldest dropped first
+MAX_SUBSCRIBERS = 32    # Open /events streams, each one holds a server thread
+SUBSCRIBER_QUEUE = 256  # Events buffered for a slow subscriber before its events get dropped
+KEEPALIVE = 15          # Seconds between comments on an idle stream so proxies keep it open
+
+class Job():
+    def __init__(self, panel, kind, detail):
+        self.id = uuid.uuid4().hex[:12]
+        self.panel = panel
+        self.kind = kind            # "layout" or "image"
+        self.detail = detail        # What the request asked for, e.g. the layout name
+        self.state = "queued"
+        self.info = {}              # Extra details from the last state change, e.g. result or error
+        self.created = time.time()
+        self.times = {"queued": 0.0}    # state -> seconds after the job was created
+
+    def describe(self):
+        return {"id": self.id, "panel": self.panel, "kind": self.kind, "detail": self.detail, "state": self.state,
+                "created": self.created, "times": dict(self.times), **self.info}
+
+class JobTracker():
+    def __init__(self, max_jobs=MAX_JOBS, max_subscribers=MAX_SUBSCRIBERS):
+        self.max_jobs = max_jobs
+        self.max_subscribers = max_subscribers
+        self.jobs = OrderedDict()   # id -> Job, oldest first
+        self.newest = {}            # panel -> id of the job created last for it
+        self.subscribers = []       # queue per open /events stream
+        self.sequence = itertools.count(1)  # Event ids
+        self.lock = threading.Lock()
+
+    # New queued job for a panel
+    def create(self, panel, kind, **detail):
+        job = Job(panel, kind, detail)
+        with self.lock:
+            self.jobs[job.id] = job
+            self.newest[panel] = job.id
+            while len(self.jobs) > self.max_jobs: self.jobs.popitem(last=False)
+            self.publish(job.describe())
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    # True when no job was created for the job's panel after it, older jobs are superseded
+    def is_newest(self, job):
+        with self.lock:
+            return self.newest.get(job.panel) == job.id
+
+    # Move job to a state, ignored for no job, finished jobs and repeats of the state it is in
+    def update(self, job, state, **info):
+        if job is None: return
+        with self.lock:
+            if job.state in FINAL_STATES or job.state == state: return
+            job.state = state
+            job.info = info
+            job.times[state] = time.time() - job.created
+            self.publish(job.describe())
+        if state in FINAL_STATES:
+            metrics.observe("job", job.times[state], kind=job.kind, state=state)
+
+    # Queue for a new /events stream, None when there are too many open already
+    def subscribe(self):
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers: return None
+            subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+            self.subscribers.append(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers: self.subscribers.remove(subscriber)
+
+    # Hand event to every subscriber, a subscriber that stopped reading misses it instead of holding up the
+    # display. Called with the lock held so every subscriber gets events in the same order
+    def publish(self, event):
+        event = dict(event, event=next(self.sequence))
+        for subscriber in self.subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                pass
+
+    # Server-Sent Events for a subscriber, only a panel's or a single job's when given. Jobs that aren't
+    # finished are sent first so a client subscribing just after its POST sees where its job is.
+    # A single job's stream ends when the job finishes
+    def stream(self, subscriber, panel=None, job_id=None):
+        def wanted(event):
+            return (panel is None or event["panel"] == panel) and (job_id is None or event["id"] == job_id)
+
+        try:
+            with self.lock:
+                current = [job.describe() for job in self.jobs.values() if job.state not in FINAL_STATES or job.id == job_id]
+            for event in current:
+                if not wanted(event): continue
+                yield format_event(event)
+                if job_id is not None and event["state"] in FINAL_STATES: return
+            while True:
+                try:
+                    event = subscriber.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if not wanted(event): continue
+                yield format_event(event)
+                if job_id is not None and event["state"] in FINAL_STATES: return
+        finally:
+            self.unsubscribe(subscriber)
+
+# Job state as one Server-Sent Event
+def format_event(event):
+    id_line = f"id: {event['event']}\n" if "event" in event else ""
+    return f"{id_line}event: job\ndata: {json.dumps(event)}\n\n"
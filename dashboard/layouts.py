@@ -0,0 +1,124 @@
+import importlib
+import sys
+import threading
+
+from refresh_policy import policy_from
+
+# Registry of display layouts. Layouts are listed by name in the manifest and only imported the first
+# time one is selected, so startup doesn't pay for layouts (and their fonts and network libraries)
+# that never get shown, and layouts no longer in use can be unloaded again.
+#
+# A layout module provides render() returning (image, changed), and optionally:
+#   render_key()             - inputs of the next render, frames are reused while it stays the same
+#   next_update(now)         - wall clock time the layout next needs redrawing
+#   export_state()           - state saved in the startup snapshot
+#   subscribe(callback)      - call callback when new data arrives, e.g. from a background fetch, so the
+#                              layout is rendered again straight away instead of at its next_update
+#   restore_state(state)     - state read back from the snapshot, given when the layout is loaded
+#   unload()                 - drop fonts, caches and threads before the module is forgotten
+# Manifest entries can name another render function, mark layouts whose render only returns an image,
+# and give the refresh policy their frames are sent with, see refresh_policy.py.
+
+MANIFEST = {
+    "clock": {"module": "modules.clock.main", "refresh": "fast"},
+    "weather": {"module": "modules.weather.main"},
+    "image": {"module": "modules.image_display.main", "refresh": "clean"},
+    "time": {"module": "modules.clock.main2", "image_only": True, "refresh": "fast"},
+    "metar": {"module": "modules.weather.main2"},
+    "weather_multi": {"module": "modules.weather.main2", "render": "render_multi"},
+}
+
+# Loaded layout, anything the manifest entry doesn't change comes straight from the module
+class Layout():
+    def __init__(self, name, module, entry):
+        self.name = name
+        self.module = module
+        self.entry = entry
+
+    def render(self):
+        result = getattr(self.module, self.entry.get("render", "render"))()
+        return (result, True) if self.entry.get("image_only") else result
+
+    def __getattr__(self, attribute):
+        return getattr(self.module, attribute)
+
+class LayoutRegistry():
+    def __init__(self, manifest=MANIFEST, on_update=None):
+        self.manifest = manifest
+        self.on_update = on_update  # Called with a layout's name when its module has new data
+        self.policies = {name: policy_from(entry.get("refresh")) for name, entry in manifest.items()}
+        self.layouts = {}       # name -> Layout for layouts that are loaded
+        self.states = {}        # name -> snapshot state for layouts not loaded yet
+        self.lock = threading.RLock()
+
+    def __contains__(self, name):
+        return name in self.manifest
+
+    # Every layout name, loaded or not
+    def names(self):
+        return list(self.manifest)
+
+    # Refresh policy a layout's frames are sent with, doesn't import the layout
+    def policy(self, name):
+        return self.policies[name]
+
+    # Names of the layouts that are imported
+    def loaded(self):
+        with self.lock:
+            return list(self.layouts)
+
+    # Layout by name, importing it the first time it's asked for
+    def get(self, name):
+        with self.lock:
+            layout = self.layouts.get(name)
+            if layout is not None: return layout
+            entry = self.manifest[name]
+            layout = Layout(name, importlib.import_module(entry["module"]), entry)
+            # Modules are subscribed once, when the first of their layouts loads
+            if hasattr(layout.module, "subscribe") and not any(other.module is layout.module for other in self.layouts.values()):
+                layout.module.subscribe(lambda module_name=entry["module"]: self.updated(module_name))
+            self.layouts[name] = layout
+            state = self.states.pop(name, None)
+            if state is not None and hasattr(layout, "restore_state"): layout.restore_state(state)
+            return layout
+
+    # Pass new data from a module on for every loaded layout using it
+    def updated(self, module_name):
+        with self.lock:
+            names = [name for name, layout in self.layouts.items() if layout.entry["module"] == module_name]
+        if self.on_update:
+            for name in names: self.on_update(name)
+
+    # Forget a layout, its module is dropped from sys.modules once no loaded layout uses it
+    def unload(self, name):
+        with self.lock:
+            layout = self.layouts.pop(name, None)
+            if layout is None: return False
+            if hasattr(layout, "export_state"): self.states[name] = layout.export_state()
+            module_name = layout.entry["module"]
+            if any(other.entry["module"] == module_name for other in self.layouts.values()): return True
+            if hasattr(layout, "unload"): layout.unload()
+
+            # Remove the module from its package too, otherwise the package keeps it alive
+            sys.modules.pop(module_name, None)
+            package_name, _, attribute = module_name.rpartition(".")
+            package = sys.modules.get(package_name)
+            if package is not None and getattr(package, attribute, None) is layout.module: delattr(package, attribute)
+            return True
+
+    # Snapshot state of every layout, loaded or not
+    def export_state(self):
+        with self.lock:
+            states = dict(self.states)
+            for name, layout in self.layouts.items():
+                if hasattr(layout, "export_state"): states[name] = layout.export_state()
+            return states
+
+    # Hand snapshot state to loaded layouts now and to the others when they are loaded
+    def restore_state(self, states):
+        with self.lock:
+            for name, state in states.items():
+                if name not in self.manifest: continue
+                layout = self.layouts.get(name)
+                if layout is None: self.states[name] = state
+                elif hasattr(layout, "restore_state"): layout.restore_state(state)
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from PIL import Image
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Library of uploaded images kept on disk. Each upload is stored once under the hash of its file and
+# fit mode, holding the panel sized grayscale from ingest plus the packed frame for every threshold /
+# dither setting it has been shown with, so showing a past image again is a file read and nothing else.
+#
+# Files are raw bytes so nothing needs decoding:
+#   <hash>.gray                        - panel sized "L" image
+#   <hash>-<threshold>-<dither>.frame  - packed frame
+#   index.json                         - entries, least recently used first, so listing never touches the files
+# The library is kept under a byte budget by dropping the least recently used images. Reads only move
+# an entry up the order in memory, the index is written when entries are added, changed or removed.
+
+INDEX_FILE = "index.json"
+
+# Library key for an uploaded file, fit is part of it since it changes the ingested image
+def image_key(data, fit=""):
+    digest = hashlib.blake2b(data, digest_size=16)
+    digest.update(fit.encode())
+    return digest.hexdigest()
+
+class ImageLibrary():
+    def __init__(self, root, max_bytes=64 * 1024 * 1024, size=(800, 480)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.size = size
+        self.entries = OrderedDict()    # key -> {"name", "added", "used", "bytes", "frames"}, oldest use first
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()   # One index write at a time, so a slow write never replaces a newer one
+        self.load()
+
+    # Read the index, starting empty when there isn't a usable one
+    def load(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path): return
+        try:
+            with open(path, encoding="utf-8") as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as error:
+            print(f"Image library index unreadable: {error}")
+            return
+        for entry in sorted(entries, key=lambda entry: entry["used"]):
+            self.entries[entry["key"]] = entry
+
+    # Write the index, to a temporary file first so a crash never leaves half an index behind
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                text = json.dumps(list(self.entries.values()))
+            self._write(os.path.join(self.root, INDEX_FILE), text.encode("utf-8"))
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    # Entries most recently used first, name is only a label and never used as a path
+    def list(self):
+        with self.lock:
+            return [dict(entry, frames=list(entry["frames"])) for entry in reversed(self.entries.values())]
+
+    # Store an ingested image under its upload's key
+    def add(self, key, img, name=""):
+        if img.mode != "L" or img.size != self.size: raise ValueError(f"Library images must be {self.size} \"L\" images")
+        if key in self:
+            self.touch(key)
+            return
+        data = img.tobytes()
+        self._write(self._gray_path(key), data)
+        now = time.time()
+        with self.lock:
+            self.entries[key] = {"key": key, "name": name, "added": now, "used": now, "bytes": len(data), "frames": []}
+        self.evict()
+        self.save()
+
+    # Panel sized grayscale image for a key, or None when the library doesn't have it
+    def gray(self, key):
+        if key not in self: return None
+        try:
+            with open(self._gray_path(key), "rb") as file:
+                return Image.frombytes("L", self.size, file.read())
+        except (OSError, ValueError) as error:
+            print(f"Image library entry {key} unreadable: {error}")
+            self.remove(key)
+            return None
+
+    # Packed frame for a key and setting, or None when it hasn't been packed with that setting yet
+    def frame(self, key, threshold, dither):
+        setting = f"{threshold}-{dither}"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or setting not in entry["frames"]: return None
+        try:
+            with open(self._frame_path(key, setting), "rb") as file:
+                frame = file.read()
+        except OSError:
+            return None
+        self.touch(key)
+        return frame
+
+    # Store packed frame for a key and setting, ignored for keys not in the library
+    def put_frame(self, key, threshold, dither, frame):
+        setting = f"{threshold}-{dither}"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or setting in entry["frames"]: return
+        self._write(self._frame_path(key, setting), frame)
+        with self.lock:
+            if setting in entry["frames"]: return       # Another thread stored the same setting meanwhile
+            entry["frames"].append(setting)
+            entry["bytes"] += len(frame)
+        self.touch(key)
+        self.evict()
+        self.save()
+
+    # Mark entry as just used so it is the last to be evicted, only in memory until the index is next saved
+    def touch(self, key):
+        with self.lock:
+            if key not in self.entries: return
+            self.entries[key]["used"] = time.time()
+            self.entries.move_to_end(key)
+
+    # Delete an entry and all of its files
+    def remove(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        if entry is None: return
+        paths = [self._gray_path(key)] + [self._frame_path(key, setting) for setting in entry["frames"]]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.save()
+
+    # Drop least recently used entries until the library fits its budget, always keeping the newest one
+    def evict(self):
+        while True:
+            with self.lock:
+                if len(self.entries) <= 1 or sum(entry["bytes"] for entry in self.entries.values()) <= self.max_bytes: return
+                key = next(iter(self.entries))
+            self.remove(key)
+
+    # Size of the library
+    def stats(self):
+        with self.lock:
+            return {"images": len(self.entries), "bytes": sum(entry["bytes"] for entry in self.entries.values()), "max_bytes": self.max_bytes}
+
+    def _gray_path(self, key):
+        return os.path.join(self.root, f"{key}.gray")
+
+    def _frame_path(self, key, setting):
+        return os.path.join(self.root, f"{key}-{setting}.frame")
+
+    # Write file through a temporary file of its own so readers never see part of it, and writers of the
+    # same file at the same time never share one
+    def _write(self, path, data):
+        os.makedirs(self.root, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
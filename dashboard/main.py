@@ -1,46 +1,144 @@
 # Imports needed to run website dashboard and other used stuff
-from flask import Flask, render_template, request
-from PIL import Image
+from collections import OrderedDict
 import threading
 import time
 import os
 
 # Import classes to talk to epaper display and all of the modules
 from epaper_display import EpaperDisplay
-from modules.clock import main as clock
-from modules.weather import main as weather
-from modules.image_display import main as image
+from framebuffer import DITHER_MODES, pack_image
+from framestore import FrameStore
+from hardware import load_backend
+from layouts import LayoutRegistry
+from ingest import FIT_MODES, MAX_UPLOAD_BYTES, submit_ingest
+from jobs import MAX_SUBSCRIBERS, JobTracker
+from library import ImageLibrary, image_key
+from metrics import metrics
+from panels import Panel, load_panel_config, panel_snapshot_path
+from pipeline import DisplayPipeline
+from playlist import DEFAULT_DWELL
+from power import PowerManager
+from preview import PngCache
+from snapshot import load_snapshot, save_snapshot
 
-current_layout = None #"weather"
-update_state = False
-image_threshold = 128
+# Panels by name in the order they were added, each holds its own display state, see panels.py
+panels = {}
+SPI_SPEED_HZ = 2_000_000    # SPI clock used to send frames to the display
+HARDWARE_BACKEND = os.environ.get("EPAPER_BACKEND", "rpi")    # "simulated" runs without a Raspberry Pi
+PANELS_PATH = os.environ.get("EPAPER_PANELS")   # json file listing the panels, one default panel without it
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "snapshot.bin")  # State kept across restarts
+frames = FrameStore()       # Packed frames that were already built or shown
+latest_frames = {}          # layout -> the last frame packed for it
+fresh_frames = {}           # (layout, threshold, dither) -> (frame, wall clock time it goes stale), shared by every panel
+SHARED_FRAME_SECONDS = 30   # How long a frame is shared when its layout has no next_update
+RETRY_SECONDS = 30          # Wait before a panel whose update raised tries again
+render_locks = {}           # layout module -> lock, modules keep module level state so one panel renders each at a time
+render_locks_lock = threading.Lock()
+pngs = PngCache()           # PNGs of frames for the preview endpoints
+preview_frames = OrderedDict()  # (image key, threshold, dither) -> frame packed for /preview, oldest first
+PREVIEW_FRAMES = 8          # Preview frames kept, outside the image library so previews never evict uploads
+preview_lock = threading.Lock()
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "library")   # Uploaded images
+library = None              # ImageLibrary, opened by get_library the first time it's needed
+layouts = LayoutRegistry(on_update=lambda name: layout_updated(name))  # Layout modules by name, each imported the first time it is shown
+jobs = JobTracker()         # Display jobs started by web requests, with their progress for /events
+MAIN2_LAYOUTS = {"time": "time", "weather": "metar", "weather_multi": "weather_multi"}   # main2.py's /display names -> layouts
+
+# Add a panel driven by this process, the first one added answers web requests that don't name a panel.
+# min_sleep enables deep sleep between updates that are at least that many seconds apart
+def add_panel(name, display, min_sleep=None):
+    panel = Panel(name, display, panel_snapshot_path(SNAPSHOT_PATH, name, first=not panels))
+    if min_sleep is not None: panel.power = PowerManager(display, min_sleep)
+    panels[name] = panel
+    return panel
+
+# Open the display for panel settings from load_panel_config
+def open_display(config):
+    pins = {"dc_pin": config["dc_pin"], "busy_pin": config["busy_pin"], "rst_pin": config["rst_pin"]}
+    backend = load_backend(HARDWARE_BACKEND, **pins) if HARDWARE_BACKEND == "simulated" else load_backend(HARDWARE_BACKEND)
+    return EpaperDisplay(spi_speed_hz=config.get("spi_speed_hz", SPI_SPEED_HZ), backend=backend,
+                         bus=config["bus"], device=config["device"], name=config["name"], **pins)
+
+# Image library, opened on first use so tests and benchmarks can point LIBRARY_PATH somewhere else first
+def get_library():
+    global library
+    if library is None: library = ImageLibrary(LIBRARY_PATH)
+    return library
+
+# Build the dashboard website
+def create_app():
+    # Flask is imported here so the display thread can get its first frame out while the website starts
+    from flask import Flask, Response, g, jsonify, render_template, request
 
-# Start website
-def start_dashboard():
     # Setup a blank flask website
     app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 64 * 1024    # Flask answers 413 to anything bigger
+
+    # PNG of a frame tagged with the frame's hash, answered with a 304 when the client already has it
+    def png_response(frame):
+        if frame is None: return "No frame", 404
+        etag, png = pngs.get(frame)
+        response = Response(png, mimetype="image/png")
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    # Panel a request is for, named by its panel field or query parameter, the first panel otherwise
+    def find_panel():
+        name = request.values.get("panel")
+        if name: return panels.get(name)
+        return next(iter(panels.values()), None)
+
+    # Time every request, labelled by the route that handled it
+    @app.before_request
+    def start_timer():
+        g.started = time.perf_counter()
+
+    @app.after_request
+    def stop_timer(response):
+        started = g.get("started")
+        if started is not None:
+            metrics.observe("http", time.perf_counter() - started, start=started, endpoint=request.endpoint or "unknown", status=response.status_code)
+        return response
 
     # Register incomming web requests 
     @app.route("/")
     def index():
-        return render_template("index.html")
+        return render_template("index.html", layouts=[name for name in layouts.names() if name != "image"], panels=list(panels))
     
     # Listions to website server state changes then triggers the state function Which handles interactions
     @app.route("/set_layout", methods=["POST"])
     def set_layout():
-        # When buttons are clicked saved thier changed state
-        global current_layout, update_state
+        # When buttons are clicked pass thier changed state to the display thread
+        panel = find_panel()
+        if panel is None:
+            return "Unknown panel", 404
         layout = request.form.get("layout")
-        if layout in ("clock", "weather", "image"):
-            current_layout = layout
-            update_state = True
-            return f"Layout set to {layout}"
+        if layout in layouts:
+            job = jobs.create(panel.name, "layout", layout=layout)
+            panel.scheduler.post("layout", layout=layout, job=job)
+            return jsonify(job.describe()), 202
         return "Invalid layout", 400
     
+    # Form api main2.py used to serve, its layout names are mapped to the layouts that replaced them
+    @app.route("/display", methods=["POST"])
+    def display_layout():
+        panel = find_panel()
+        if panel is None:
+            return "Unknown panel", 404
+        layout = MAIN2_LAYOUTS.get(request.form.get("layout"))
+        if layout is None:
+            return "Unknown layout", 400
+        job = jobs.create(panel.name, "layout", layout=layout)
+        panel.scheduler.post("layout", layout=layout, job=job)
+        return jsonify(job.describe()), 202
+
     # Images require a speical server state /display_image which it's interactions is handled here
     @app.route("/display_image", methods=["POST"])
     def download_image():
-        global current_layout, update_state, image_threshold
+        panel = find_panel()
+        if panel is None:
+            return "Unknown panel", 404
         # If no image is sent, ir no file name is recived return error
         if "image" not in request.files:
             return "No image uploaded", 400
@@ -51,63 +149,527 @@ def start_dashboard():
         # Read threshold from the hidden input
         threshold_str = request.form.get("threshold")
         try:
-            image_threshold = int(threshold_str)
+            threshold = int(threshold_str)
+        except (TypeError, ValueError):
+            threshold = 128
+
+        fit = request.form.get("fit", "contain")
+        if fit not in FIT_MODES:
+            return "Invalid fit", 400
+        dither = request.form.get("dither", "threshold")
+        if dither not in DITHER_MODES:
+            return "Invalid dither", 400
+
+        # Images already in the library go straight to the panel's display thread. Otherwise they are
+        # decoded and shrunk to panel size in the ingest process, which posts them when it's done, so
+        # the request returns the job without waiting either way
+        data = file.read()
+        key = image_key(data, fit)
+        job = jobs.create(panel.name, "image", image=key, name=file.filename, threshold=threshold, dither=dither)
+        show = {"key": key, "threshold": threshold, "dither": dither, "job": job}
+        if key in get_library():
+            panel.scheduler.post("image", **show)
+        else:
+            jobs.update(job, "rendering", stage="ingest")
+            started = time.perf_counter()
+            submit_ingest(data, fit).add_done_callback(lambda future: ingested(future, panel, file.filename, fit, started, show))
+        return jsonify(job.describe()), 202
+
+    # Past uploads, most recently shown first
+    @app.route("/library")
+    def list_library():
+        return jsonify(entries=get_library().list(), **get_library().stats())
+
+    # Show a past upload again, with the threshold and dither it was last shown with unless new ones are given
+    @app.route("/library/<key>/display", methods=["POST"])
+    def display_library_image(key):
+        panel = find_panel()
+        if panel is None:
+            return "Unknown panel", 404
+        if key not in get_library():
+            return "Unknown image", 404
+        try:
+            threshold = int(request.form.get("threshold", panel.threshold))
         except ValueError:
-            image_threshold = 128
-
-        # Store image in memery for moduel to use, and update other required paremeters
-        img = Image.open(file.stream).convert("1")
-        image.set_image(img)     
-        current_layout = "image" 
-        update_state = True
-        return "Image uploaded", 200
+            return "Invalid threshold", 400
+        dither = request.form.get("dither", panel.dither)
+        if dither not in DITHER_MODES:
+            return "Invalid dither", 400
+        job = jobs.create(panel.name, "image", image=key, threshold=threshold, dither=dither)
+        panel.scheduler.post("image", key=key, threshold=threshold, dither=dither, job=job)
+        return jsonify(job.describe()), 202
+
+    # A panel's playlist of layouts and images, replaced whole by posting {"entries": [...], "running": true}
+    @app.route("/playlist", methods=["GET", "POST"])
+    def playlist_route():
+        panel = find_panel()
+        if panel is None:
+            return "Unknown panel", 404
+        playlist = panel.playlist
+        if request.method == "POST":
+            body = request.get_json(silent=True) or {}
+            entries = body.get("entries", [])
+            error = check_entries(entries)
+            if error is not None:
+                return error, 400
+            playlist.set(entries)
+            if body.get("running", True): playlist.start()
+            else: playlist.stop()
+            panel.scheduler.post("playlist")
+        return jsonify(playlist.export_state())
+
+    @app.route("/playlist/start", methods=["POST"])
+    def start_playlist():
+        panel = find_panel()
+        if panel is None:
+            return "Unknown panel", 404
+        panel.playlist.start()
+        panel.scheduler.post("playlist")
+        return jsonify(panel.playlist.export_state())
+
+    @app.route("/playlist/stop", methods=["POST"])
+    def stop_playlist():
+        panel = find_panel()
+        if panel is None:
+            return "Unknown panel", 404
+        panel.playlist.stop()
+        panel.scheduler.post("playlist")
+        return jsonify(panel.playlist.export_state())
+
+    @app.route("/library/<key>", methods=["DELETE"])
+    def delete_library_image(key):
+        if key not in get_library():
+            return "Unknown image", 404
+        get_library().remove(key)
+        return "Image deleted", 200
     
-    # Start the web server
+    # What a panel is showing as a 1 bit PNG
+    @app.route("/frame.png")
+    def frame_png():
+        panel = find_panel()
+        if panel is None:
+            return "Unknown panel", 404
+        return png_response(frames.showing(panel.name))
+
+    # Last frame packed for a layout, whether or not it is showing
+    @app.route("/frame/<layout>.png")
+    def layout_png(layout):
+        if layout not in layouts:
+            return "Unknown layout", 404
+        return png_response(latest_frames.get(layout))
+
+    # An uploaded image as it would look on the panel with a threshold and dither. Frames the library already
+    # has are reused, others are kept in preview_frames so moving a slider back and forth only packs each
+    # setting once without filling the library with settings that are never shown
+    @app.route("/preview")
+    def preview():
+        panel = find_panel()
+        key = request.args.get("image", panel.image if panel else None)
+        if key not in get_library():
+            return "Unknown image", 404
+        try:
+            threshold = int(request.args.get("threshold", 128))
+        except ValueError:
+            return "Invalid threshold", 400
+        dither = request.args.get("dither", "threshold")
+        if dither not in DITHER_MODES:
+            return "Invalid dither", 400
+
+        setting = (key, threshold, dither)
+        with preview_lock:
+            frame = preview_frames.get(setting)
+            if frame is not None: preview_frames.move_to_end(setting)
+        if frame is None: frame = get_library().frame(key, threshold, dither)
+        if frame is None:
+            img = get_library().gray(key)
+            if img is None:
+                return "Unknown image", 404
+            frame = pack_image(img, pngs.width, pngs.height, threshold, color_black=pngs.color_black, dither=dither)
+            with preview_lock:
+                preview_frames[setting] = frame
+                while len(preview_frames) > PREVIEW_FRAMES: preview_frames.popitem(last=False)
+        return png_response(frame)
+
+    # Layouts that can be shown and the ones imported right now
+    @app.route("/layouts")
+    def list_layouts():
+        return jsonify(layouts=layouts.names(), loaded=layouts.loaded(),
+                       refresh={name: layouts.policy(name).describe() for name in layouts.names()})
+
+    # Unload a layout that isn't showing to free its memory, it's imported again if it gets selected
+    @app.route("/layouts/<name>/unload", methods=["POST"])
+    def unload_layout(name):
+        if name not in layouts:
+            return "Unknown layout", 404
+        if any(panel.showing_layout() == name for panel in panels.values()):
+            return "Layout is showing", 409
+        layouts.unload(name)
+        return jsonify(layouts=layouts.names(), loaded=layouts.loaded())
+
+    # State of a job returned by a POST
+    @app.route("/jobs/<job_id>")
+    def job_state(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return "Unknown job", 404
+        return jsonify(job.describe())
+
+    # Job states as Server-Sent Events, for one panel or one job when given, a job's stream ends with it
+    @app.route("/events")
+    def events():
+        subscriber = jobs.subscribe()
+        if subscriber is None:
+            return f"More than {MAX_SUBSCRIBERS} event streams open", 503
+        stream = jobs.stream(subscriber, request.args.get("panel"), request.args.get("job"))
+        response = Response(stream, mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        response.call_on_close(lambda: jobs.unsubscribe(subscriber))     # Also when the client leaves before the first event
+        return response
+
+    # Every panel with its layout, playlist and pipeline counters
+    @app.route("/panels")
+    def list_panels():
+        return jsonify(panels=[panel.describe() for panel in panels.values()])
+
+    # Stage timings and counters for Prometheus
+    @app.route("/metrics")
+    def prometheus_metrics():
+        stats = frames.stats()
+        counters = {
+            "epaper_frame_cache_hits_total": ("Frames reused instead of rendered and packed", stats["hits"]),
+            "epaper_frame_cache_misses_total": ("Frames that had to be rendered and packed", stats["misses"]),
+            "epaper_frame_cache_skips_total": ("Refreshes skipped because the frame was already showing", stats["skips"]),
+        }
+        return Response(metrics.prometheus_text(counters), mimetype="text/plain; version=0.0.4")
+
+    # Timeline of the last refreshes for chrome://tracing or ui.perfetto.dev
+    @app.route("/trace.json")
+    def trace():
+        try:
+            refreshes = int(request.args.get("refreshes", 10))
+        except ValueError:
+            return "Invalid refreshes", 400
+        return jsonify(metrics.chrome_trace(max(1, refreshes)))
+
+    # Report how many renders and display refreshes the frame store saved
+    @app.route("/stats")
+    def stats():
+        return jsonify(frames.stats())
+
+    return app
+
+# Finish an upload once the ingest process has decoded it, runs on the ingest pool's callback thread
+def ingested(future, panel, name, fit, started, show):
+    metrics.observe("ingest", time.perf_counter() - started, start=started, fit=fit)
+    job = show["job"]
+    try:
+        img = future.result()
+    except Exception as error:      # Anything raised here would leave the job hanging
+        jobs.update(job, "failed", error=str(error))
+        return
+    try:
+        get_library().add(show["key"], img, name)
+    except OSError as error:
+        print(f"Saving image to library failed: {error}")
+
+    # Store image in memery for moduel to use
+    with render_lock("image"):
+        layouts.get("image").set_image(img, show["key"])
+
+    # Something else was asked of the panel while the image decoded
+    if not jobs.is_newest(job):
+        jobs.update(job, "cancelled", reason="superseded")
+        return
+    panel.scheduler.post("image", **show)
+
+# Start website
+def start_dashboard():
+    app = create_app()
     app.run(host="0.0.0.0", port=5000, threaded=True)
 
-# Check for display layout changes and run timmer circuits 
-def display_loop(display):
-    last_layout = None
-    current_display = None
+# Lock held while a layout's module renders. Layouts from the same module share it, other layouts render
+# at the same time, so one slow layout never holds up a panel showing another
+def render_lock(layout):
+    module_name = layouts.manifest[layout]["module"]
+    with render_locks_lock:
+        return render_locks.setdefault(module_name, threading.RLock())
+
+# Get packed frame for a layout, reusing stored frames when the module reports the same render inputs.
+# Panels showing the same layout share its frames: layouts without render inputs reuse a frame until the
+# layout's next update, and a layout that hasn't changed since another panel rendered it gives that
+# panel's frame back. Returns None when the module has nothing to display
+def render_frame(display, module, layout, threshold, dither="threshold", force=False):
+    now = time.time()
+    shared = (layout, threshold, dither)
+    with render_lock(layout):
+        key = None
+        if hasattr(module, "render_key"):
+            key = shared + (module.render_key(),)
+            frame = frames.get(key)
+            if frame is not None: return frame
+        else:
+            frame, stale = fresh_frames.get(shared, (None, 0))
+            if now < stale: return frame
+
+        with metrics.timer("render", layout=layout):
+            img, changed = module.render()
+        if img is None: return None
+        if not (changed or force) and shared in fresh_frames:
+            frame = fresh_frames[shared][0]
+        elif not (changed or force):
+            return None
+        else:
+            with metrics.timer("pack", dither=dither):
+                frame = display.pack_image(img, threshold, dither=dither)
+            frames.put(frame, key)
+        stale = module.next_update(now) if hasattr(module, "next_update") else now + SHARED_FRAME_SECONDS
+        fresh_frames[shared] = (frame, stale)
+    return frame
+
+# Packed frame for the image layout. Frames for images in the library are read back from it, and images
+# not held in memory are loaded from it, so showing a past image never decodes anything
+def image_frame(display, key, threshold, dither):
+    frame = get_library().frame(key, threshold, dither)
+    if frame is not None: return frame
+    # Panels can show different images, the module's image is swapped and rendered under one lock
+    with render_lock("image"):
+        image = layouts.get("image")
+        if key is not None and image.render_key() != key:
+            img = get_library().gray(key)
+            if img is None: return None
+            image.set_image(img, key)
+        frame = render_frame(display, image, "image", threshold, dither)
+    if frame is not None:
+        try:
+            get_library().put_frame(key, threshold, dither, frame)
+        except OSError as error:
+            print(f"Saving frame to library failed: {error}")
+    return frame
+
+# Packed frame for a playlist entry, force gets a frame even when the layout hasn't changed since it
+# last rendered, which is needed when the entry has just come up
+def entry_frame(display, entry, force):
+    layout = entry["layout"]
+    if layout == "image":
+        if not force: return None
+        return image_frame(display, entry["image"], entry.get("threshold", 128), entry.get("dither", "threshold"))
+    return render_frame(display, layouts.get(layout), layout, entry.get("threshold", 128), force=force)
+
+# Frame for the playlist entry on a panel, moving to the next entry when its dwell time is up.
+# The next entry's frame is normally already built by prefetch so switching costs only the refresh
+def playlist_frame(panel):
+    now = time.time()
+    if not panel.playlist.due(now):
+        current = panel.playlist.current()
+        return entry_frame(panel.display, current[1], force=False) if current else None
+
+    position, entry = panel.playlist.advance(now)
+    panel.layout = entry["layout"]
+    prefetched = panel.prefetched
+    if prefetched is not None and prefetched[0] == position and (prefetched[2] is None or now < prefetched[2]):
+        frame = prefetched[1]
+    else:
+        frame = entry_frame(panel.display, entry, force=True)
+    panel.prefetched = None
+    return frame
+
+# Build the next playlist entry's frame while the current one is going to the display
+def prefetch(panel):
+    upcoming = panel.playlist.upcoming()
+    if upcoming is None or (panel.prefetched is not None and panel.prefetched[0] == upcoming[0]): return
+    position, entry = upcoming
+    frame = entry_frame(panel.display, entry, force=True)
+    if frame is None: return
+    # Layouts that change on their own, like the clock, go stale at their next update
+    module = layouts.get(entry["layout"])
+    stale = module.next_update(time.time()) if entry["layout"] != "image" and hasattr(module, "next_update") else None
+    panel.prefetched = (position, frame, stale)
 
+# Check playlist entries sent from the website, returns an error message or None when they are usable
+def check_entries(entries):
+    if not isinstance(entries, list): return "Entries must be a list"
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get("layout") not in layouts: return f"Invalid entry {entry}"
+        if not isinstance(entry.get("dwell", DEFAULT_DWELL), (int, float)): return f"Invalid dwell in {entry}"
+        if not isinstance(entry.get("threshold", 128), int): return f"Invalid threshold in {entry}"
+        if entry.get("dither", "threshold") not in DITHER_MODES: return f"Invalid dither in {entry}"
+        if entry["layout"] == "image" and entry.get("image") not in get_library(): return f"Unknown image in {entry}"
+    return None
+
+# Apply events posted by web requests. Bursts are merged so only the newest layout and image get drawn,
+# the jobs of the ones replaced are cancelled
+def handle_events(panel, events):
+    for kind, data in events:
+        job = data.get("job")
+        if job is not None:
+            jobs.update(panel.job, "cancelled", reason="superseded")
+            panel.job = job
+        if kind == "layout":
+            panel.playlist.stop()
+            panel.layout = data["layout"]
+            panel.update_state = True
+        elif kind == "image":
+            panel.playlist.stop()
+            panel.layout = "image"
+            panel.threshold = data["threshold"]
+            panel.dither = data.get("dither", "threshold")
+            panel.image = data.get("key", panel.image)
+            panel.update_state = True
+
+# A layout's module has new data, e.g. a weather observation. Its shared frames are dropped and the
+# panels showing it are woken to render it now rather than at the layout's next update
+def layout_updated(name):
+    for key in [key for key in list(fresh_frames) if key[0] == name]: fresh_frames.pop(key, None)
+    for panel in list(panels.values()):
+        if panel.showing_layout() == name: panel.scheduler.post("updated", layout=name)
+
+# Wall clock time a panel's layout next needs updating, None when it only changes on events
+def next_deadline(panel):
+    deadlines = [panel.playlist.deadline()]
+    module = layouts.get(panel.layout) if panel.layout in layouts else None
+    if module is not None and hasattr(module, "next_update"): deadlines.append(module.next_update(time.time()))
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    return min(deadlines) if deadlines else None
+
+# Display refresh failed, nothing is known to be showing so the next update redraws it
+def refresh_failed(panel, error):
+    print(f"Display refresh failed on {panel.name}: {error}")
+    frames.reset_shown(panel.name)
+    # Nobody knows what the panel shows now, so a restart mustn't trust the saved frame either
+    save_state(panel, panel_state(panel), None)
+
+# Handle a panel's queued events then run its layout. Frames go to the panel's pipeline when it has one,
+# otherwise they are sent straight to the display and the refresh the display did is returned
+def update_display(panel):
+    handle_events(panel, panel.scheduler.drain())
+    job, panel.job = panel.job, None
+    jobs.update(job, "rendering")
+    try:
+        frame = panel_frame(panel)
+    except Exception as error:
+        jobs.update(job, "failed", error=str(error))
+        raise
+
+    if frame is not None: latest_frames[panel.layout] = frame
+    result = send_frame(panel, frame, job)
+    if panel.playlist.running: prefetch(panel)
+    return result
+
+# Frame a panel's layout or playlist needs sent, None when nothing changed
+def panel_frame(panel):
+    # Depending on what layout is selected run indavidual classes which have thier own built in timing circuits
+    # For images every time a new image is uplouded change image
+    if panel.playlist.running:
+        return playlist_frame(panel)
+    elif(panel.layout=="image"):
+        if(panel.update_state==True):
+            panel.update_state=False
+            return image_frame(panel.display, panel.image, panel.threshold, panel.dither)
+    # Run every other layout's time curcit, the layout is imported the first time it's shown
+    elif panel.layout in layouts:
+        return render_frame(panel.display, layouts.get(panel.layout), panel.layout, panel.threshold)
+    return None
+
+# Send frame unless it's already showing on the panel, e.g. when two playlist entries look the same.
+# The layout's refresh policy decides between clean, fast and partial refreshes. job, when the frame
+# was asked for by a web request, is moved through its states as the frame goes up
+def send_frame(panel, frame, job=None):
+    if frame is None or not frames.show(frame, panel.name):
+        jobs.update(job, "done", result="unchanged")
+        return None
+    # The snapshot is saved once the frame is on the panel, with the state the frame was rendered from
+    state = panel_state(panel)
+    policy = layouts.policy(panel.layout) if panel.layout in layouts else None
+    if panel.pipeline is not None:
+        panel.pipeline.submit(frame, policy, job, on_sent=lambda: save_state(panel, state, frame))
+        return None
+    try:
+        jobs.update(job, "transferring")
+        if panel.power is not None: panel.power.wake()
+        result = panel.display.display_frame(frame, policy, progress=lambda stage: jobs.update(job, stage))
+        save_state(panel, state, frame)
+        jobs.update(job, "done", result=result or "unchanged")
+        return result
+    except Exception as error:
+        jobs.update(job, "failed", error=str(error))
+        refresh_failed(panel, error)
+        return None
+
+# A panel's layout, threshold and module state for its snapshot
+def panel_state(panel):
+    return {
+        "layout": panel.layout,
+        "threshold": panel.threshold,
+        "dither": panel.dither,
+        "image": panel.image,
+        "playlist": panel.playlist.export_state(),
+        "modules": layouts.export_state(),
+    }
+
+# Save a panel's state and the frame it shows so a restart can resume from them, a frame of None makes the
+# restart refresh the panel in full
+def save_state(panel, state, frame):
+    try:
+        save_snapshot(panel.snapshot_path, state, frame)
+    except OSError as error:
+        print(f"Saving snapshot failed: {error}")
+
+# Resume a panel from its last snapshot. The display keeps its image while powered off, so the saved
+# frame is treated as already showing and only changes since then get sent
+def restore_state(panel):
+    state, frame = load_snapshot(panel.snapshot_path)
+    if state is None: return
+    panel.layout = state.get("layout")
+    panel.threshold = state.get("threshold", panel.threshold)
+    panel.dither = state.get("dither", panel.dither)
+    panel.image = state.get("image")
+    panel.update_state = True
+    panel.playlist.restore_state(state.get("playlist", {}))
+    layouts.restore_state(state.get("modules", {}))
+    if frame is not None and len(frame) == panel.display.buffer_length:
+        panel.display.last_frame = frame
+        frames.put(frame)
+        frames.show(frame, panel.name)
+
+# Render a panel's frames then sleep until its layout's next deadline or a web request wakes it up.
+# Frames are sent by the panel's pipeline thread so rendering carries on while the display refreshes,
+# the pipeline also gets the deadline so it can put the display to sleep until then
+def display_loop(panel):
+    panel.pipeline = DisplayPipeline(panel.display, on_error=lambda error: refresh_failed(panel, error), power=panel.power,
+                                     on_progress=jobs.update)
     while True:
-        # If layout changes refreash display
-        global current_layout, update_state, image_threshold
-        if current_layout != last_layout:    
-            last_layout = current_layout
-            current_display = None
-        update_display = False
-
-        # Depending on what layout is selected run indavidual classes which have thier own built in timing circuits
-        # For images every time a new image is uplouded change image
-        if(current_layout=="image"):
-            if(update_state==True):
-                update_state=False
-                img, update_display = image.render()
-                if update_display: current_display = img
-        # Run weather time curcit
-        elif(current_layout=="weather"):
-            img, update_display = weather.render()
-            if update_display: current_display = img
-        # Run clock time curcit
-        elif(current_layout=="clock"):
-            img, update_display = clock.render()
-            if update_display: current_display = img
-
-        # Update display if requested and wait before running check again
-        if(update_display): display.display_image(current_display, image_threshold)
-        time.sleep(1)
+        # A layout that raises mustn't stop the panel for good, it's tried again after a pause
+        try:
+            update_display(panel)
+            deadline = next_deadline(panel)
+        except Exception as error:
+            print(f"Display update failed on {panel.name}: {error}")
+            deadline = time.time() + RETRY_SECONDS
+        panel.pipeline.set_deadline(deadline)
+        panel.scheduler.wait(deadline)
+
+# Display thread for one panel, initializes its display first so panels reset in parallel.
+# default_layout is shown when there is no snapshot to resume from
+def run_panel(panel, default_layout=None):
+    panel.display.initalize_display()
+    restore_state(panel)
+    if panel.layout is None: panel.layout = default_layout
+    display_loop(panel)
+
+# Start a panel's display thread
+def start_panel(panel, default_layout=None):
+    panel.thread = threading.Thread(target=run_panel, args=(panel, default_layout), name=f"display-{panel.name}", daemon=True)
+    panel.thread.start()
 
 # Startup script when file is ran
-def main():
-    # Initilize the Epaper display
-    display = EpaperDisplay()
-    display.initalize_display()
-    
-    # Create background thread that starts and runs website
-    threading.Thread(target=start_dashboard, daemon=True).start()
+# default_layout is shown on panels that have no snapshot to resume from and no layout of their own
+def main(default_layout=None):
+    # Initilize every Epaper display, each in its own thread
+    for config in load_panel_config(PANELS_PATH):
+        panel = add_panel(config["name"], open_display(config), config["min_sleep"])
+        start_panel(panel, config.get("layout", default_layout))
 
-    display_loop(display)
+    # Run website, the panels are already getting their first frames out while it starts
+    start_dashboard()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,140 @@
+from bisect import bisect_left
+from collections import deque
+import json
+import os
+import threading
+import time
+
+# Timings and counters for every stage of getting a frame onto the panel: layout render, image ingest,
+# pack, SPI transfer, BUSY wait, weather fetches and HTTP handlers.
+#   - stage timings go into histograms with fixed buckets, so recording one is a bisect and an add
+#   - counters hold totals like SPI bytes and syscalls
+#   - recent timings are also kept as trace events that load in chrome://tracing or Perfetto
+# Everything is served by /metrics in Prometheus' text format and /trace.json.
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+TRACE_EVENTS = 4096     # trace events kept, oldest dropped first
+
+class Histogram():
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # last count is for values above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+# Times a block of code as a stage, labels can still be added inside the block
+class Timer():
+    def __init__(self, metrics, stage, labels):
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, start=self.start, **self.labels)
+        return False
+
+class Metrics():
+    def __init__(self, buckets=BUCKETS, trace_events=TRACE_EVENTS):
+        self.buckets = buckets
+        self.histograms = {}        # (stage, labels) -> Histogram
+        self.counters = {}          # (name, labels) -> value
+        self.descriptions = {}      # counter name -> help text
+        self.trace = deque(maxlen=trace_events)    # (stage, start, duration, thread id, labels)
+        self.lock = threading.Lock()
+
+    # Time a block: with metrics.timer("pack"): ...
+    def timer(self, stage, **labels):
+        return Timer(self, stage, labels)
+
+    # Record how long a stage took, start is its perf_counter start time when known
+    def observe(self, stage, seconds, start=None, **labels):
+        if start is None: start = time.perf_counter() - seconds
+        key = (stage, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None: histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            self.trace.append((stage, start, seconds, threading.get_ident(), labels))
+
+    # Add to a counter
+    def count(self, name, amount=1, description="", **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            if description: self.descriptions.setdefault(name, description)
+
+    # Everything in Prometheus' text exposition format. extra_counters adds values kept elsewhere,
+    # e.g. frame store hits, as {name: (help, value)}
+    def prometheus_text(self, extra_counters=None):
+        with self.lock:
+            histograms = sorted((key, list(value.counts), value.sum, value.count) for key, value in self.histograms.items())
+            counters = sorted(self.counters.items())
+            descriptions = dict(self.descriptions)
+
+        lines = ["# HELP epaper_stage_seconds Time spent in each stage of the display pipeline",
+                 "# TYPE epaper_stage_seconds histogram"]
+        for (stage, labels), counts, total, count in histograms:
+            label_text = format_labels((("stage", stage),) + labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"epaper_stage_seconds_bucket{format_labels((('stage', stage),) + labels + (('le', le),))} {cumulative}")
+            lines.append(f"epaper_stage_seconds_sum{label_text} {total}")
+            lines.append(f"epaper_stage_seconds_count{label_text} {count}")
+
+        named = {}
+        for (name, labels), value in counters: named.setdefault(name, []).append((labels, value))
+        for name, (description, value) in (extra_counters or {}).items():
+            descriptions[name] = description
+            named.setdefault(name, []).append(((), value))
+        for name, values in named.items():
+            if name in descriptions: lines.append(f"# HELP {name} {descriptions[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in values: lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Trace events covering the last refreshes, as Chrome trace json. Everything that overlapped the
+    # oldest of those refreshes is included, e.g. the render and pack that led up to it
+    def chrome_trace(self, refreshes=10):
+        with self.lock:
+            events = list(self.trace)
+        refresh_starts = [start for stage, start, duration, thread, labels in events if stage == "refresh"]
+        since = refresh_starts[-refreshes] if len(refresh_starts) >= refreshes else (refresh_starts[0] if refresh_starts else None)
+        if since is not None: events = [event for event in events if event[1] + event[2] >= since]
+
+        process = os.getpid()
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [{"name": stage, "cat": "epaper", "ph": "X", "ts": start * 1e6, "dur": duration * 1e6,
+                             "pid": process, "tid": thread, "args": labels} for stage, start, duration, thread, labels in events],
+        }
+
+    # Write chrome_trace to a file
+    def dump_trace(self, path, refreshes=10):
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(refreshes), file)
+
+# Labels as a sorted tuple of strings so they can be used as a dict key
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+# Prometheus label set like {stage="pack"}, empty when there are no labels
+def format_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Shared by every part of the dashboard
+metrics = Metrics()
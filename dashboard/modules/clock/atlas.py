@@ -0,0 +1,72 @@
+from PIL import Image, ImageDraw
+import math
+
+# Pre-rendered 1 bit glyph cells for a font. Each cell is a white image with one piece of text drawn
+# in black, as wide as the text's advance and as tall as the font's line, so text can be put
+# together by pasting cells next to each other instead of going through FreeType every time.
+class GlyphAtlas():
+    def __init__(self, font, texts=()):
+        self.font = font
+        try:
+            ascent, descent = font.getmetrics()
+            self.height = ascent + descent
+        except AttributeError:
+            self.height = font.getbbox("0Ag")[3]        # Bitmap fonts have no metrics
+        self.cells = {}
+        for text in texts:
+            self.add(text)
+
+    # Render text into a new cell
+    def add(self, text):
+        width = max(1, math.ceil(self.font.getlength(text)))
+        cell = Image.new("1", (width, self.height), 255)
+        ImageDraw.Draw(cell).text((0, 0), text, font=self.font, fill=0)
+        self.cells[text] = cell
+        return cell
+
+    # Cell for text, rendered the first time it is asked for
+    def cell(self, text):
+        cell = self.cells.get(text)
+        return cell if cell is not None else self.add(text)
+
+    # Split text into cells, whole text when the atlas has it otherwise one cell per character
+    def parts(self, text):
+        return [text] if text in self.cells else list(text)
+
+    # Width of text when built from cells
+    def width(self, text):
+        return sum(self.cell(part).width for part in self.parts(text))
+
+# Image that is built up from atlas cells and only repaints cells that changed. Each slot is a named
+# position on the image, pasting the same text into the same slot again costs nothing
+class CellCanvas():
+    def __init__(self, size):
+        self.image = Image.new("1", size, 255)
+        self.slots = {}     # slot -> (box, key) of what was last pasted there
+
+    # Paste image into slot, clearing what the slot held before if it moved or changed
+    def paste(self, slot, xy, image, key):
+        box = (xy[0], xy[1], xy[0] + image.width, xy[1] + image.height)
+        previous = self.slots.get(slot)
+        if previous == (box, key): return False
+        if previous is not None: self.image.paste(255, previous[0])
+        self.image.paste(image, box[:2])
+        self.slots[slot] = (box, key)
+        return True
+
+    # Paste text from an atlas starting at xy, one slot per cell, returns the width used
+    def text(self, slot, xy, atlas, text):
+        x, y = xy
+        parts = atlas.parts(text)
+        for number, part in enumerate(parts):
+            cell = atlas.cell(part)
+            self.paste((slot, number), (x, y), cell, (id(atlas), part))
+            x += cell.width
+        self.clear_from(slot, len(parts))
+        return x - xy[0]
+
+    # Clear cells left over in a text slot from longer text that used to be there
+    def clear_from(self, slot, number):
+        while (slot, number) in self.slots:
+            self.image.paste(255, self.slots.pop((slot, number))[0])
+            number += 1
@@ -0,0 +1,139 @@
+from bisect import bisect_left
+import calendar
+import datetime
+import json
+import os
+
+# Holiday calendar. Holiday rules are compiled into a sorted table of dates for each year the
+# first time that year is needed, after that finding the next holiday is a binary search.
+#
+# Rules are dicts, either a fixed date or the nth weekday of a month (nth -1 is the last one):
+#   {"name": "Christmas Day", "month": 12, "day": 25}
+#   {"name": "Thanksgiving", "month": 11, "weekday": 3, "nth": 4}
+# Adding "observed": true moves a holiday that lands on a weekend to the Friday before or Monday after.
+# A rule for February 29 or a 5th weekday is left out of the years that don't have that day.
+# Extra or regional rule sets can be loaded from json files holding a list of rules, rules in them that
+# don't make sense are left out with a message saying why.
+
+US_HOLIDAYS = [
+    {"name": "New Year's Day", "month": 1, "day": 1},
+    {"name": "Juneteenth", "month": 6, "day": 19},
+    {"name": "Independence Day", "month": 7, "day": 4},
+    {"name": "Veterans Day", "month": 11, "day": 11},
+    {"name": "Christmas Day", "month": 12, "day": 25},
+    {"name": "MLK Day", "month": 1, "weekday": 0, "nth": 3},
+    {"name": "Presidents Day", "month": 2, "weekday": 0, "nth": 3},
+    {"name": "Memorial Day", "month": 5, "weekday": 0, "nth": -1},
+    {"name": "Labor Day", "month": 9, "weekday": 0, "nth": 1},
+    {"name": "Columbus Day", "month": 10, "weekday": 0, "nth": 2},
+    {"name": "Thanksgiving", "month": 11, "weekday": 3, "nth": 4},
+]
+
+# Date of the nth weekday in a month, weekday 0 is Monday
+def nth_weekday(year, month, weekday, n):
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+# Date of the last weekday in a month
+def last_weekday(year, month, weekday):
+    last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+# Move weekend holidays to the nearest weekday
+def observed_date(date):
+    if date.weekday() == 5: return date - datetime.timedelta(days=1)
+    if date.weekday() == 6: return date + datetime.timedelta(days=1)
+    return date
+
+# Date a rule falls on in a year, None when the year doesn't have it
+def rule_date(rule, year):
+    if "day" in rule:
+        if rule["day"] > calendar.monthrange(year, rule["month"])[1]: return None
+        date = datetime.date(year, rule["month"], rule["day"])
+    elif rule["nth"] == -1:
+        date = last_weekday(year, rule["month"], rule["weekday"])
+    else:
+        date = nth_weekday(year, rule["month"], rule["weekday"], rule["nth"])
+        # No 5th weekday this month, don't let it spill into the next
+        if date.month != rule["month"]: return None
+    return observed_date(date) if rule.get("observed") else date
+
+# True for whole numbers, json true and false aren't
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+# What is wrong with a rule, None when it is usable
+def rule_error(rule):
+    if not isinstance(rule, dict): return "rule must be an object"
+    if not isinstance(rule.get("name"), str) or not rule["name"]: return "name is missing"
+    month = rule.get("month")
+    if not is_int(month) or not 1 <= month <= 12: return "month must be 1 to 12"
+    if "day" in rule:
+        days = calendar.monthrange(2000, month)[1]  # A leap year, so February 29 is allowed
+        if not is_int(rule["day"]) or not 1 <= rule["day"] <= days: return f"day must be 1 to {days} in month {month}"
+    elif "weekday" in rule and "nth" in rule:
+        if not is_int(rule["weekday"]) or not 0 <= rule["weekday"] <= 6: return "weekday must be 0 (Monday) to 6 (Sunday)"
+        if not is_int(rule["nth"]) or rule["nth"] not in (1, 2, 3, 4, 5, -1): return "nth must be 1 to 5, or -1 for the last"
+    else:
+        return "rule needs a day, or a weekday and nth"
+    if not isinstance(rule.get("observed", False), bool): return "observed must be true or false"
+    return None
+
+# Read list of rules from a json file, rules that don't make sense are skipped with a message
+def load_rules(path):
+    with open(path, encoding="utf-8") as file:
+        rules = json.load(file)
+    if not isinstance(rules, list): raise ValueError(f"{path} must hold a list of holiday rules")
+    valid = []
+    for number, rule in enumerate(rules, 1):
+        error = rule_error(rule)
+        if error is None: valid.append(rule)
+        else: print(f"Skipping holiday rule {number} in {path}: {error}: {rule}")
+    return valid
+
+class HolidayCalendar():
+    def __init__(self, rules=US_HOLIDAYS):
+        self.rules = list(rules)
+        self.tables = {}        # year -> ([dates], [names]) sorted by date
+        self.last_lookup = None # (day, result) of the last next_holiday call
+
+    # Sorted holiday table for a year, built the first time the year is used
+    def table(self, year):
+        table = self.tables.get(year)
+        if table is None:
+            holidays = []
+            for rule in self.rules:
+                date = rule_date(rule, year)
+                if date is not None: holidays.append((date, rule["name"]))
+            holidays.sort()
+            table = ([date for date, name in holidays], [name for date, name in holidays])
+            self.tables[year] = table
+        return table
+
+    # Next holiday on or after a day as (name, days until it), 0 days when it is today
+    def next_holiday(self, today=None):
+        if today is None: today = datetime.date.today()
+        if self.last_lookup is not None and self.last_lookup[0] == today: return self.last_lookup[1]
+        if not self.rules: return None, None
+
+        # Observed dates can move a holiday into the year before or after, so look one year ahead
+        result = (None, None)
+        for year in (today.year - 1, today.year, today.year + 1, today.year + 2):
+            dates, names = self.table(year)
+            index = bisect_left(dates, today)
+            if index < len(dates):
+                result = (names[index], (dates[index] - today).days)
+                break
+        self.last_lookup = (today, result)
+        return result
+
+# Build calendar from the built in US holidays plus any rule files that exist
+def load_calendar(paths=(), include_default=True):
+    rules = list(US_HOLIDAYS) if include_default else []
+    for path in paths:
+        if not os.path.exists(path): continue
+        try:
+            rules.extend(load_rules(path))
+        except (OSError, ValueError) as error:
+            print(f"Holiday rules unreadable: {error}")
+    return HolidayCalendar(rules)
@@ -1,5 +1,15 @@
 from PIL import Image
 
+from scheduler import next_minute
+
+# Render inputs for the frame store, the clock layout is currently a blank page
+def render_key():
+    return "blank"
+
+# Clock changes at the start of every minute
+def next_update(now):
+    return next_minute(now)
+
 def render():
     img = Image.new("1", (800, 480), color=255)
-    return img, True
\ No newline at end of file
+    return img, True
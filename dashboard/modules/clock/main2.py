@@ -1,89 +1,57 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import datetime
+import os
 
-# ================= FONTS =================
-try:
-    FONT_LARGE = ImageFont.truetype(
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 120
-    )
-    FONT_MEDIUM = ImageFont.truetype(
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 50
-    )
-    FONT_SMALL = ImageFont.truetype(
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 40
-    )
-    FONT_TINY = ImageFont.truetype(
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 20
-    )
-except:
-    FONT_LARGE = ImageFont.load_default()
-    FONT_MEDIUM = ImageFont.load_default()
-    FONT_SMALL = ImageFont.load_default()
-    FONT_TINY = ImageFont.load_default()
+from modules.clock.atlas import CellCanvas, GlyphAtlas
+from modules.clock.holidays import load_calendar
+from modules.fonts import load_font, unload_fonts
+from scheduler import next_minute
 
-FONT_HOLIDAY = FONT_SMALL
-FONT_DAYS = FONT_TINY
+# ================= FONTS =================
+# Font sizes, the fonts and glyph atlases are loaded the first time the clock is drawn
+FONT_LARGE = 120
+FONT_MEDIUM = 50
+FONT_HOLIDAY = 40
+FONT_DAYS = 20
+
+# ================= GLYPH ATLAS =================
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+_atlases = None     # (large atlas, medium atlas, height of the time text) once loaded
+_canvas = None      # Clock frame kept between renders, only changed cells get repainted
+
+def load_atlases():
+    """Glyph atlases for the time and date, built on first use"""
+    global _atlases, _canvas
+    if _atlases is None:
+        large = GlyphAtlas(load_font(FONT_LARGE), "0123456789:")
+        medium = GlyphAtlas(load_font(FONT_MEDIUM), list("0123456789/") + ["AM", "PM"] + WEEKDAYS)
+        _atlases = (large, medium, load_font(FONT_LARGE).getbbox("0123456789:")[3])
+        _canvas = CellCanvas((800, 480))
+    return _atlases
+
+def unload():
+    """Drop fonts, atlases and the kept frame, called when the layout is unloaded"""
+    global _atlases, _canvas, _holiday_block
+    _atlases = None
+    _canvas = None
+    _holiday_block = (None, None)
+    unload_fonts()
 
 # ================= HOLIDAYS =================
-def nth_weekday(year, month, weekday, n):
-    d = datetime.date(year, month, 1)
-    count = 0
-    while True:
-        if d.weekday() == weekday:
-            count += 1
-            if count == n:
-                return d
-        d += datetime.timedelta(days=1)
-
-def first_weekday(year, month, weekday):
-    return nth_weekday(year, month, weekday, 1)
-
-def second_weekday(year, month, weekday):
-    return nth_weekday(year, month, weekday, 2)
-
-def third_weekday(year, month, weekday):
-    return nth_weekday(year, month, weekday, 3)
-
-def fourth_weekday(year, month, weekday):
-    return nth_weekday(year, month, weekday, 4)
-
-def last_weekday(year, month, weekday):
-    d = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
-    while d.weekday() != weekday:
-        d -= datetime.timedelta(days=1)
-    return d
+# Extra or regional holiday rule files, loaded when they exist
+HOLIDAY_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "holidays.json")]
+_calendar = None
 
 def get_holiday_info(today=None):
-    if today is None:
-        today = datetime.date.today()
-
-    year = today.year
-    holidays = {
-        datetime.date(year, 1, 1): "New Year's Day",
-        datetime.date(year, 6, 19): "Juneteenth",
-        datetime.date(year, 7, 4): "Independence Day",
-        datetime.date(year, 11, 11): "Veterans Day",
-        datetime.date(year, 12, 25): "Christmas Day",
-        third_weekday(year, 1, 0): "MLK Day",
-        third_weekday(year, 2, 0): "Presidents Day",
-        last_weekday(year, 5, 0): "Memorial Day",
-        first_weekday(year, 9, 0): "Labor Day",
-        second_weekday(year, 10, 0): "Columbus Day",
-        fourth_weekday(year, 11, 3): "Thanksgiving",
-    }
-
-    if today in holidays:
-        return holidays[today], 0
-
-    upcoming = []
-    for d, name in holidays.items():
-        future = d if d >= today else datetime.date(year + 1, d.month, d.day)
-        upcoming.append(((future - today).days, name))
-
-    upcoming.sort()
-    return upcoming[0][1], upcoming[0][0]
+    global _calendar
+    if _calendar is None: _calendar = load_calendar(HOLIDAY_FILES)
+    return _calendar.next_holiday(today)
 
 # ================= RENDER =================
+def next_update(now):
+    """Clock changes at the start of every minute"""
+    return next_minute(now)
+
 def render():
     now = datetime.datetime.now()
     time_text = now.strftime("%I:%M")
@@ -97,29 +65,37 @@ def render():
         else f"{holiday_name}\n{days_until} days"
     )
 
-    img = Image.new("1", (800, 480), 255)
-    draw = ImageDraw.Draw(img)
-
+    atlas_large, atlas_medium, time_height = load_atlases()
     x, y = 50, 50
-    draw.text((x, y), time_text, font=FONT_LARGE, fill=0)
+    w = _canvas.text("time", (x, y), atlas_large, time_text)
+    _canvas.text("am_pm", (x + w + 10, y + time_height // 2), atlas_medium, am_pm)
 
-    w, h = draw.textsize(time_text, font=FONT_LARGE)
-    draw.text((x + w + 10, y + h // 2), am_pm, font=FONT_MEDIUM, fill=0)
+    _canvas.text("date", (x, 250), atlas_medium, date_str)
+    _canvas.text("day", (x, 320), atlas_medium, day_str)
 
-    draw.text((x, 250), date_str, font=FONT_MEDIUM, fill=0)
-    draw.text((x, 320), day_str, font=FONT_MEDIUM, fill=0)
+    block = render_holiday(holiday_text)
+    _canvas.paste("holiday", (800 - block.width - 20, 480 - block.height - 20), block, holiday_text)
 
-    lines = holiday_text.split("\n")
-    total_h = sum(
-        draw.textsize(l, FONT_HOLIDAY if i == 0 else FONT_DAYS)[1]
-        for i, l in enumerate(lines)
-    )
+    return _canvas.image.copy()
 
-    y = 480 - total_h - 20
-    for i, line in enumerate(lines):
-        font = FONT_HOLIDAY if i == 0 else FONT_DAYS
-        w, h = draw.textsize(line, font)
-        draw.text((800 - w - 20, y), line, font=font, fill=0)
+_holiday_block = (None, None)   # (text, image) of the last holiday block drawn
+
+def render_holiday(holiday_text):
+    """Holiday text right aligned in its own image, only drawn again when the text changes"""
+    global _holiday_block
+    if _holiday_block[0] == holiday_text:
+        return _holiday_block[1]
+
+    lines = holiday_text.split("\n")
+    fonts = [load_font(FONT_HOLIDAY if i == 0 else FONT_DAYS) for i in range(len(lines))]
+    sizes = [(int(font.getlength(line)), font.getbbox(line)[3]) for line, font in zip(lines, fonts)]
+    block = Image.new("1", (max(w for w, h in sizes), sum(h for w, h in sizes)), 255)
+    draw = ImageDraw.Draw(block)
+
+    y = 0
+    for line, font, (w, h) in zip(lines, fonts, sizes):
+        draw.text((block.width - w, y), line, font=font, fill=0)
         y += h
 
-    return img
+    _holiday_block = (holiday_text, block)
+    return block
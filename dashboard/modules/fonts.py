@@ -0,0 +1,19 @@
+from functools import lru_cache
+from PIL import ImageFont
+
+# Fonts shared by the layouts, loaded the first time a layout draws with them instead of when the
+# layout is imported, and dropped again when the layout is unloaded
+
+DEJAVU_BOLD = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+# Truetype font at a size, falling back to PIL's built in font when the file isn't installed
+@lru_cache(maxsize=None)
+def load_font(size, path=DEJAVU_BOLD):
+    try:
+        return ImageFont.truetype(path, size)
+    except OSError:
+        return ImageFont.load_default()
+
+# Forget loaded fonts so their memory can be freed
+def unload_fonts():
+    load_font.cache_clear()
@@ -1,14 +1,24 @@
 # modules/image_display/main.py
-from PIL import Image
 import threading
 
 _uploaded_image = None
+_upload_key = None
+_upload_count = 0
 _lock = threading.Lock()
 
-def set_image(img):
-    global _uploaded_image
+# Keep uploaded image, ingest has already made it a panel sized grayscale image nothing else holds.
+# key names the image, e.g. its image library key, uploads without one get a new key each time
+def set_image(img, key=None):
+    global _uploaded_image, _upload_key, _upload_count
     with _lock:
-        _uploaded_image = img.copy()
+        _uploaded_image = img
+        _upload_count += 1
+        _upload_key = key if key is not None else _upload_count
+
+# Render inputs for the frame store, every upload gets a new key
+def render_key():
+    with _lock:
+        return _upload_key
 
 def render():
     with _lock:
@@ -0,0 +1,161 @@
+from array import array
+import csv
+import math
+import mmap
+import os
+import struct
+import sys
+
+# Compact spatial index of airports for nearest airport lookups. It is built once from the
+# OurAirports airports.csv, keeping only the ICAO code, position and type of each airport, and
+# stored as a binary file that gets memory mapped so loading it is instant.
+#
+# Airports are sorted into 1 degree grid cells, queries search rings of cells outwards from the
+# location until no closer airport can exist.
+#
+# Build the index with: python -m modules.weather.airport_index data/airports.csv data/airports.idx
+
+MAGIC = b"APIX"
+VERSION = 1
+HEADER = struct.Struct("<4sII")     # magic, version, airport count
+CELLS_LAT, CELLS_LON = 180, 360
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+AIRPORT_TYPES = ("small_airport", "medium_airport", "large_airport")
+
+# Calulates distances using sphereical coordinates .i.e. haversine distance of earth
+def haversine_distance(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi / 2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+# Grid cell row and column a location falls in
+def cell_of(latitude, longitude):
+    row = min(CELLS_LAT - 1, max(0, int(math.floor(latitude + 90))))
+    column = int(math.floor(longitude + 180)) % CELLS_LON
+    return row, column
+
+# Read airports.csv and write the binary index
+def build_index(airports_csv, index_path):
+    airports = []
+    with open(airports_csv, newline="", encoding="utf-8") as csvfile:
+        for row in csv.DictReader(csvfile):
+            if row["type"] not in AIRPORT_TYPES: continue   # Skip airport types that don't report weather
+            code = (row.get("icao_code") or row.get("gps_code") or "").strip().upper()
+            if not code or len(code) > 4: continue          # METARs need an ICAO style code
+            latitude, longitude = float(row["latitude_deg"]), float(row["longitude_deg"])
+            airports.append((cell_of(latitude, longitude), code, latitude, longitude, AIRPORT_TYPES.index(row["type"])))
+    airports.sort()
+
+    # Each cell's airports sit next to each other, offsets[cell] is the first airport in the cell
+    offsets = array("I", [0] * (CELLS_LAT * CELLS_LON + 1))
+    for (row, column), *_ in airports:
+        offsets[row * CELLS_LON + column + 1] += 1
+    for cell in range(1, len(offsets)):
+        offsets[cell] += offsets[cell - 1]
+
+    latitudes = array("f", (airport[2] for airport in airports))
+    longitudes = array("f", (airport[3] for airport in airports))
+    codes = b"".join(airport[1].encode("ascii").ljust(4, b" ") for airport in airports)
+    types = bytes(airport[4] for airport in airports)
+
+    # Write to a temporary file first so a reader never sees a half written index
+    temporary_path = index_path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(airports)))
+        file.write(offsets.tobytes())
+        file.write(latitudes.tobytes())
+        file.write(longitudes.tobytes())
+        file.write(codes)
+        file.write(types)
+    os.replace(temporary_path, index_path)
+    return len(airports)
+
+class AirportIndex():
+    def __init__(self, index_path):
+        with open(index_path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION: raise ValueError(f"{index_path} is not a version {VERSION} airport index")
+
+        # Views straight into the mapped file, nothing gets copied
+        view = memoryview(self.map)
+        start = HEADER.size
+        cell_count = CELLS_LAT * CELLS_LON + 1
+        self.offsets = view[start:start + cell_count * 4].cast("I")
+        start += cell_count * 4
+        self.latitudes = view[start:start + self.count * 4].cast("f")
+        start += self.count * 4
+        self.longitudes = view[start:start + self.count * 4].cast("f")
+        start += self.count * 4
+        self.codes = view[start:start + self.count * 4]
+        start += self.count * 4
+        self.types = view[start:start + self.count]
+
+    # Airport details in the same shape as an airports.csv row
+    def airport(self, number):
+        return {
+            "icao_code": bytes(self.codes[number * 4:number * 4 + 4]).decode("ascii").strip(),
+            "latitude_deg": self.latitudes[number],
+            "longitude_deg": self.longitudes[number],
+            "type": AIRPORT_TYPES[self.types[number]],
+        }
+
+    # Numbers of airports in the cells on the edge of a square ring of cells around a cell
+    def ring(self, row, column, radius):
+        columns = range(column - radius, column + radius + 1)
+        for ring_row in range(row - radius, row + radius + 1):
+            if ring_row < 0 or ring_row >= CELLS_LAT: continue
+            edge = ring_row in (row - radius, row + radius)
+            for ring_column in (columns if edge else (column - radius, column + radius)):
+                cell = ring_row * CELLS_LON + ring_column % CELLS_LON
+                yield from range(self.offsets[cell], self.offsets[cell + 1])
+
+    # Closest k airports to a location as a list of (distance in km, airport) nearest first
+    def nearest(self, latitude, longitude, k=1):
+        row, column = cell_of(latitude, longitude)
+        found = []
+        seen = set()
+        for radius in range(max(CELLS_LAT, CELLS_LON // 2) + 1):
+            for number in self.ring(row, column, radius):
+                if number in seen: continue     # Rings wider than the world overlap themselves
+                seen.add(number)
+                distance = haversine_distance(latitude, longitude, self.latitudes[number], self.longitudes[number])
+                found.append((distance, number))
+            found.sort()
+            del found[k:]
+
+            # Anything outside the rings searched is at least radius degrees away in latitude or
+            # longitude. Longitude degrees shrink towards the poles and great circles cut across
+            # them, so the bound uses the highest latitude reachable and a 2/pi factor
+            if len(found) == k:
+                highest_latitude = min(90.0, abs(latitude) + radius + 1)
+                bound = radius * KM_PER_DEGREE * 2 / math.pi * math.cos(math.radians(highest_latitude))
+                if found[-1][0] <= bound: break
+        return [(distance, self.airport(number)) for distance, number in found]
+
+    def close(self):
+        for view in (self.offsets, self.latitudes, self.longitudes, self.codes, self.types):
+            view.release()
+        self.map.close()
+
+# Load index for a csv file, building or rebuilding it first when it is missing or older than the csv.
+# The csv is only needed to build the index, an index deployed without it is used as it is
+def load_index(airports_csv, index_path=None):
+    index_path = index_path or os.path.splitext(airports_csv)[0] + ".idx"
+    if not os.path.exists(index_path):
+        build_index(airports_csv, index_path)
+    elif os.path.exists(airports_csv) and os.path.getmtime(index_path) < os.path.getmtime(airports_csv):
+        build_index(airports_csv, index_path)
+    return AirportIndex(index_path)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python -m modules.weather.airport_index airports.csv airports.idx")
+        sys.exit(1)
+    count = build_index(sys.argv[1], sys.argv[2])
+    print(f"Indexed {count} airports into {sys.argv[2]}")
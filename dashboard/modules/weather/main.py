@@ -1,13 +1,18 @@
 from PIL import Image
-import requests
-import math
 import time
-import csv
 import os
 
+from modules.weather.airport_index import load_index
+from modules.weather.service import MetarService
+
 script_directory = os.path.dirname(os.path.abspath(__file__))
 
+UPDATE_INTERVAL = 5 * 60    # seconds between weather updates
+NO_DATA_RETRY = 5           # seconds between renders while there is no weather to show yet
+STATION_CANDIDATES = 5      # nearest airports to try when the closest has no METAR
+LOCATION_TTL = 24 * 60 * 60 # seconds a saved location is trusted for after a restart
 _last_update = 0
+_located_at = None          # When location_data was looked up
 _cache_img = None
 location_data = {
     'latitude': None,
@@ -18,58 +23,90 @@ location_data = {
     'airport_distance': None
 }
 
+# Keeps METAR data up to date in a background thread, with the last good data saved to disk
+service = MetarService(os.path.join(script_directory, "data", "metar_cache.json"), max_age=UPDATE_INTERVAL)
+_rendered_observation = None    # Observation time of the METAR the cached image was drawn from
+
+# Time the weather is next due to be checked again
+def next_update(now):
+    if _cache_img is None: return now
+    if _rendered_observation is None: return now + NO_DATA_RETRY
+    return _last_update + UPDATE_INTERVAL
+
+# Location and station for the startup snapshot
+def export_state():
+    return {"location": location_data, "located_at": _located_at}
+
+# Restore location from the startup snapshot so it isn't looked up again until it expires
+def restore_state(state):
+    global _located_at
+    located_at = state.get("located_at")
+    if located_at is None or time.time() - located_at >= LOCATION_TTL: return
+    location_data.update(state.get("location", {}))
+    _located_at = located_at
+
+# New observations wake the display straight away
+def subscribe(callback):
+    service.on_update = callback
+
+# Stop the background weather updates, called when the layout is unloaded
+def unload():
+    service.stop()
+
+# Find location and weather station then fetch its METAR, runs on the weather service's thread
+def update_weather():
+    global _located_at
+    # Nothing to do while the station's saved data is still fresh, e.g. just after a restart
+    airport = location_data['airport']
+    if airport is not None and not service.is_stale(airport['icao_code']): return
+
+    if any(location_data[key] is None for key in ['latitude', 'longitude', 'city', 'region']):
+        latitude, longitude, city, region = get_current_location()
+        location_data.update({'latitude': latitude,'longitude': longitude, 'city': city,'region': region})
+        if latitude is not None: _located_at = time.time()
+    if location_data['latitude'] is None: return
+
+    # Use last airport that reported weather, otherwise work out from the closest airport until one has a METAR
+    metar_data = None
+    if location_data['airport'] is not None:
+        metar_data = fetch_metar(location_data['airport']['icao_code'])
+    if not metar_data:
+        airports_csv = os.path.join(script_directory, "data", "airports.csv")
+        for airport_distance, airport in find_nearest_airports(location_data['latitude'], location_data['longitude'], airports_csv, STATION_CANDIDATES):
+            metar_data = fetch_metar(airport['icao_code'])
+            if metar_data:
+                location_data.update({'airport': airport,'airport_distance': airport_distance})
+                break
+
+# Draw from the latest data the service has, never waits on the network
 def render():
-    global _last_update, _cache_img, script_directory
-    now = time.time()
-    if _cache_img is None or now - _last_update >= 5 * 60:
-        _cache_img = Image.new("1", (800, 480), color=1)
-        _last_update = now
-
-        import os
-        print(f"Current directory: {os.getcwd()}")
-        print(f"File exists: {os.path.exists('data/airports.csv')}")
-
-        if any(location_data[key] is None for key in ['latitude', 'longitude', 'city', 'region']):
-            latitude, longitude, city, region = get_current_location()
-            location_data.update({'latitude': latitude,'longitude': longitude, 'city': city,'region': region})
-        
-        if any(location_data[key] is None for key in ['airport', 'airport_distance']):
-            airports_csv = os.path.join(script_directory, "data", "airports.csv")
-            airport, airport_distance = find_nearest_airport(location_data['latitude'], location_data['longitude'], airports_csv)
-            location_data.update({'airport': airport,'airport_distance': airport_distance})
-        
-        print(f"latitude: {location_data['latitude']}")
-        print(f"longitude: {location_data['longitude']}")
-        print(f"city: {location_data['city']}")
-        print(f"region: {location_data['region']}")
-        print(f"airport: {location_data['airport']}")
-        print(f"airport_distance: {location_data['airport_distance']}")
+    global _last_update, _cache_img, _rendered_observation
+    service.start(update_weather)
+    _last_update = time.time()
 
-    
-        metar_data = fetch_metar(location_data['airport']['icao_code'])
-        print(metar_data)
+    observed = None
+    if location_data['airport'] is not None:
+        observed = service.latest(location_data['airport']['icao_code'])[1]
 
+    # Only draw again when a new observation has arrived, and only then does the panel need the frame
+    changed = _cache_img is None or observed != _rendered_observation
+    if changed:
+        _cache_img = Image.new("1", (800, 480), color=1)
+        _rendered_observation = observed
 
-    return _cache_img, False 
+    return _cache_img, changed
 
-# Get metter from a specific airport
+# Get metter from a specific airport, only downloads it again when it changed since the last request
 def fetch_metar(icao_code):
-    # Build aviationweather.gov with desierd station
-    url = f"https://aviationweather.gov/api/data/metar?ids={icao_code}&format=json"
-
-    # Make request to website for data
-    resp = requests.get(url)
-    resp.raise_for_status()
-
-    # Parse and return JSON data
-    data = resp.json()
+    service.fetch(icao_code)
+    data, observed = service.latest(icao_code)
     return data
 
 # Get current location info using ip address
 def get_current_location():
     try:
         # Attempt to get the location data from the current ip using ipinfo.io
-        response = requests.get("https://ipinfo.io/json")
+        response = service.session.get("https://ipinfo.io/json", timeout=service.timeout)
         response.raise_for_status()
         location_data = response.json()
 
@@ -91,35 +128,18 @@ def get_current_location():
         print("Error getting location:", error)
         return None, None, None, None
     
-# Calulates distances using sphereical coordinates .i.e. haversine distance of earth
-def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 6371.0  
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_phi / 2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+# Airport index, loaded the first time an airport is looked up
+_airport_index = None
+
+# Finds closest airports to a location as a list of (distance in km, airport) nearest first
+def find_nearest_airports(latitude, longitude, airports_csv, count=1):
+    global _airport_index
+    if _airport_index is None: _airport_index = load_index(airports_csv)
+    return _airport_index.nearest(latitude, longitude, count)
 
 # Finds closest airport to a location
 def find_nearest_airport(latitude, longitude, airports_csv):
-    # Airport types and used variables
-    valid_types = {"small_airport", "medium_airport", "large_airport"}
-    nearest_airport = None
-    min_distance = float("inf")
-    # Open cvs file to find airport data
-    with open(airports_csv, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row["type"] not in valid_types: continue # Skip airport types not in list 
-
-            # Search through list if a closer airport exist use it instead
-            airport_lat = float(row["latitude_deg"])
-            airport_lon = float(row["longitude_deg"])
-            distance = haversine_distance(latitude, longitude, airport_lat, airport_lon)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_airport = row
-    # return found airport data       
-    return nearest_airport, min_distance
\ No newline at end of file
+    nearest = find_nearest_airports(latitude, longitude, airports_csv)
+    if not nearest: return None, float("inf")
+    distance, airport = nearest[0]
+    return airport, distance
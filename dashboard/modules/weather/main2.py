@@ -1,70 +1,85 @@
 # modules/weather/main.py - FIXED VERSION
-from PIL import Image, ImageDraw, ImageFont
-import requests
-import xml.etree.ElementTree as ET
+from PIL import Image, ImageDraw
+import os
+import time
+
+from metrics import metrics
+from modules.fonts import load_font
+from modules.weather.service import MetarService
+
+script_directory = os.path.dirname(os.path.abspath(__file__))
 
 SCREEN_W, SCREEN_H = 800, 480
+STATIONS = ["KSFO", "KOAK", "KSJC", "KHAF", "KSQL", "KPAO"]    # Stations shown on the multi station layout
+TILE_COLUMNS, TILE_ROWS = 2, 3
+UPDATE_INTERVAL = 5 * 60    # seconds between weather updates
+NO_DATA_RETRY = 5           # seconds between renders while no station has data yet
 
-# Font setup - MUST MATCH YOUR DISPLAY SIZE
-try:
-    FONT_LARGE = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 80)
-    FONT_MEDIUM = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 32)
-    FONT_SMALL = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 24)
-except:
-    FONT_LARGE = ImageFont.load_default()
-    FONT_MEDIUM = ImageFont.load_default()
-    FONT_SMALL = ImageFont.load_default()
-
-def fetch_metar(station="KSFO"):
-    """Get METAR XML data"""
-    url = f"https://aviationweather.gov/api/data/metar?ids={station}&format=xml"
-    try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        return r.text
-    except Exception as e:
-        print(f"METAR fetch failed: {e}")
-        return None
+# Fetches every station in one request on a background thread, rendering only reads what it last got
+service = MetarService(os.path.join(script_directory, "data", "metar_stations.json"), max_age=UPDATE_INTERVAL)
+_last_update = 0
 
-def parse_metar(xml_text):
-    """Parse METAR XML to dict"""
-    if not xml_text:
-        return None
-    
-    try:
-        root = ET.fromstring(xml_text)
-        metar = root.find(".//METAR")
-        if metar is None:
-            return None
-            
-        def get_text(tag):
-            el = metar.find(tag)
-            return el.text if el is not None else None
-            
-        return {
-            "raw_text": get_text("raw_text"),
-            "temp_c": get_text("temp_c"),
-            "dewpoint_c": get_text("dewpoint_c"),
-            "wind_speed_kt": get_text("wind_speed_kt"),
-            "wind_gust_kt": get_text("wind_gust_kt"),
-            "wind_dir_degrees": get_text("wind_dir_degrees"),
-            "visibility_statute_mi": get_text("visibility_statute_mi"),
-            "sea_level_pressure_mb": get_text("sea_level_pressure_mb"),
-            "altim_in_hg": get_text("altim_in_hg"),
-            "wx_string": get_text("wx_string")
-        }
-    except Exception as e:
-        print(f"XML parse failed: {e}")
+# Font sizes - MUST MATCH YOUR DISPLAY SIZE, fonts are loaded the first time they are drawn with
+FONT_LARGE = 80
+FONT_MEDIUM = 32
+FONT_SMALL = 24
+
+def update_stations():
+    """Fetch the METARs of every station, runs on the weather service's thread"""
+    if not any(service.is_stale(station) for station in STATIONS): return
+    service.fetch_group(STATIONS)
+
+def metar_fields(data):
+    """METAR json response to the fields the layouts draw, None without a report"""
+    if not data:
         return None
+    report = data[0]
+    altimeter = report.get("altim")     # hPa in the json api
+    return {
+        "raw_text": report.get("rawOb"),
+        "station_id": report.get("icaoId"),
+        "observation_time": report.get("obsTime") or report.get("reportTime"),
+        "temp_c": report.get("temp"),
+        "dewpoint_c": report.get("dewp"),
+        "wind_speed_kt": report.get("wspd"),
+        "wind_gust_kt": report.get("wgst"),
+        "wind_dir_degrees": report.get("wdir"),
+        "visibility_statute_mi": report.get("visib"),
+        "sea_level_pressure_mb": report.get("slp"),
+        "altim_in_hg": f"{altimeter * 0.02953:.2f}" if isinstance(altimeter, (int, float)) else None,
+        "wx_string": report.get("wxString"),
+    }
+
+def latest_metar(station):
+    """Station's METAR fields from the service, never waits on the network"""
+    data, observed = service.latest(station)
+    return metar_fields(data)
+
+def next_update(now):
+    """Time the weather is next due to be checked again"""
+    if not _last_update: return now
+    if all(service.latest(station)[0] is None for station in STATIONS): return now + NO_DATA_RETRY
+    return _last_update + UPDATE_INTERVAL
+
+def subscribe(callback):
+    """New observations wake the display straight away"""
+    service.on_update = callback
 
 # ================= RENDER FUNCTION =================
-def render():
-    """MAIN RENDER FUNCTION - Returns 800x480 image for e-paper"""
-    print("[WEATHER] Starting render()")
+_station_image = (None, None)   # (observation_time, image) the single station layout last drew
+
+def render(station=None):
+    """MAIN RENDER FUNCTION - Returns 800x480 image for e-paper and whether it changed"""
+    global _last_update, _station_image
+    service.start(update_stations)
+    _last_update = time.time()
+    station = station or STATIONS[0]
     
-    # Get METAR data
-    xml_data = fetch_metar("KSFO")
-    metar = parse_metar(xml_data)
+    # Get METAR data, only draw again when a new observation has arrived
+    metar = latest_metar(station)
+    observed = metar.get("observation_time") if metar else None
+    if _station_image[1] is not None and _station_image[0] == observed:
+        return _station_image[1], False
     
     # CREATE THE IMAGE - THIS IS WHAT WAS MISSING
     img = Image.new("1", (SCREEN_W, SCREEN_H), 1)  # 1-bit, white background
@@ -72,73 +87,135 @@ def render():
     
     if metar and metar.get("raw_text"):
         raw_metar = metar["raw_text"]
-        print(f"[WEATHER] Got METAR: {raw_metar[:50]}...")
-        
-        # Print to terminal
-        print("\n" + "="*60)
-        print(f"RAW METAR DATA: {raw_metar}")
-        print("="*60)
         
         # Draw header
-        header = "KSFO - San Francisco"
-        w, _ = draw.textsize(header, font=FONT_MEDIUM)
-        draw.text(((SCREEN_W - w) // 2, 20), header, font=FONT_MEDIUM, fill=0)
+        header = "KSFO - San Francisco" if station == "KSFO" else station
+        w, _ = text_size(draw, header, load_font(FONT_MEDIUM))
+        draw.text(((SCREEN_W - w) // 2, 20), header, font=load_font(FONT_MEDIUM), fill=0)
         
         # Draw temperature
-        if metar.get("temp_c"):
+        if metar.get("temp_c") is not None:
             temp_c = float(metar["temp_c"])
             temp_f = round(temp_c * 9/5 + 32)
             temp_text = f"{temp_f}°F"
-            w_temp, h_temp = draw.textsize(temp_text, font=FONT_LARGE)
-            draw.text(((SCREEN_W - w_temp) // 2, 120), temp_text, font=FONT_LARGE, fill=0)
+            w_temp, h_temp = text_size(draw, temp_text, load_font(FONT_LARGE))
+            draw.text(((SCREEN_W - w_temp) // 2, 120), temp_text, font=load_font(FONT_LARGE), fill=0)
             
             # Draw temperature in Celsius too
-            draw.text(((SCREEN_W - w_temp) // 2, 210), f"({temp_c}°C)", font=FONT_SMALL, fill=0)
+            draw.text(((SCREEN_W - w_temp) // 2, 210), f"({temp_c}°C)", font=load_font(FONT_SMALL), fill=0)
         
         # Draw wind info
         wind_text = f"Wind: {metar.get('wind_dir_degrees', '--')}° @ {metar.get('wind_speed_kt', '--')}kt"
         if metar.get("wind_gust_kt"):
             wind_text += f" G{metar['wind_gust_kt']}kt"
-        draw.text((50, 280), wind_text, font=FONT_SMALL, fill=0)
+        draw.text((50, 280), wind_text, font=load_font(FONT_SMALL), fill=0)
         
         # Draw visibility
         if metar.get("visibility_statute_mi"):
             vis_text = f"Visibility: {metar['visibility_statute_mi']} miles"
-            draw.text((50, 310), vis_text, font=FONT_SMALL, fill=0)
+            draw.text((50, 310), vis_text, font=load_font(FONT_SMALL), fill=0)
         
         # Draw pressure
         if metar.get("altim_in_hg"):
             press_text = f"Pressure: {metar['altim_in_hg']} inHg"
-            draw.text((50, 340), press_text, font=FONT_SMALL, fill=0)
+            draw.text((50, 340), press_text, font=load_font(FONT_SMALL), fill=0)
         elif metar.get("sea_level_pressure_mb"):
             press_text = f"Pressure: {metar['sea_level_pressure_mb']} hPa"
-            draw.text((50, 340), press_text, font=FONT_SMALL, fill=0)
+            draw.text((50, 340), press_text, font=load_font(FONT_SMALL), fill=0)
         
         # Draw weather condition
         if metar.get("wx_string"):
             wx_text = f"Weather: {metar['wx_string']}"
-            draw.text((50, 250), wx_text, font=FONT_SMALL, fill=0)
+            draw.text((50, 250), wx_text, font=load_font(FONT_SMALL), fill=0)
         
         # Draw raw METAR at bottom
         raw_display = raw_metar
         if len(raw_display) > 70:
             raw_display = raw_display[:67] + "..."
-        draw.text((20, 400), f"METAR: {raw_display}", font=FONT_SMALL, fill=0)
+        draw.text((20, 400), f"METAR: {raw_display}", font=load_font(FONT_SMALL), fill=0)
         
     else:
-        print("[WEATHER] No METAR data available")
+        metrics.count("epaper_weather_no_data_total", 1, "Weather frames drawn without METAR data", station=station)
         # Draw error message
         error_text = "NO WEATHER DATA AVAILABLE"
-        w_err, h_err = draw.textsize(error_text, font=FONT_LARGE)
+        w_err, h_err = text_size(draw, error_text, load_font(FONT_LARGE))
         draw.text(((SCREEN_W - w_err) // 2, SCREEN_H // 2 - h_err // 2), 
-                 error_text, font=FONT_LARGE, fill=0)
+                 error_text, font=load_font(FONT_LARGE), fill=0)
     
-    print("[WEATHER] render() completed, returning image")
-    return img
+    _station_image = (observed, img)
+    return img, True
+
+# ================= MULTI STATION RENDER =================
+_station_tiles = {}     # station -> (observation_time, tile image), tiles are only redrawn when the observation changes
+
+def text_size(draw, text, font):
+    """Width and height of text"""
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    return right - left, bottom - top
+
+def render_tile(station, metar, size):
+    """Draw one station's weather into a tile"""
+    tile = Image.new("1", size, 1)
+    draw = ImageDraw.Draw(tile)
+    draw.rectangle((0, 0, size[0] - 1, size[1] - 1), outline=0)
+    draw.text((10, 8), station, font=load_font(FONT_MEDIUM), fill=0)
+    if not metar:
+        draw.text((10, 60), "No data", font=load_font(FONT_SMALL), fill=0)
+        return tile
+
+    if metar.get("temp_c") is not None:
+        temp_f = round(float(metar["temp_c"]) * 9/5 + 32)
+        temp_text = f"{temp_f}°F"
+        w, _ = text_size(draw, temp_text, load_font(FONT_MEDIUM))
+        draw.text((size[0] - w - 10, 8), temp_text, font=load_font(FONT_MEDIUM), fill=0)
+    wind_text = f"Wind {metar.get('wind_dir_degrees') or '--'}° @ {metar.get('wind_speed_kt') or '--'}kt"
+    if metar.get("wind_gust_kt"):
+        wind_text += f" G{metar['wind_gust_kt']}"
+    draw.text((10, 60), wind_text, font=load_font(FONT_SMALL), fill=0)
+    details = []
+    if metar.get("visibility_statute_mi"):
+        details.append(f"Vis {metar['visibility_statute_mi']}mi")
+    if metar.get("wx_string"):
+        details.append(metar["wx_string"])
+    draw.text((10, 95), "  ".join(details), font=load_font(FONT_SMALL), fill=0)
+    return tile
+
+def render_multi(stations=None):
+    """Returns 800x480 image with a tile per station and whether any tile changed, the service fetches them in a single request"""
+    global _last_update
+    service.start(update_stations)
+    _last_update = time.time()
+    stations = stations or STATIONS
+    tile_size = (SCREEN_W // TILE_COLUMNS, SCREEN_H // TILE_ROWS)
+
+    img = Image.new("1", (SCREEN_W, SCREEN_H), 1)
+    changed = False
+    for number, station in enumerate(stations[:TILE_COLUMNS * TILE_ROWS]):
+        metar = latest_metar(station)
+        observed = metar.get("observation_time") if metar else None
+        cached = _station_tiles.get(station)
+        if cached is None or cached[0] != observed:
+            # Keep old tile if the station didn't report this time
+            if metar or cached is None:
+                cached = (observed, render_tile(station, metar, tile_size))
+                _station_tiles[station] = cached
+                changed = True
+        column, row = number % TILE_COLUMNS, number // TILE_COLUMNS
+        img.paste(cached[1], (column * tile_size[0], row * tile_size[1]))
+    return img, changed
+
+def unload():
+    """Drop cached tiles, stop the background updates and close pooled connections, called when the layout is unloaded"""
+    global _station_image
+    _station_tiles.clear()
+    _station_image = (None, None)
+    service.stop()
 
 # Test the module
 if __name__ == "__main__":
     print("Testing weather module...")
-    test_image = render()
+    service.background = False
+    update_stations()
+    test_image, changed = render()
     test_image.save("weather_test.png")
     print("Saved weather_test.png for verification")
\ No newline at end of file
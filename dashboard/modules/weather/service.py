@@ -0,0 +1,196 @@
+import codecs
+import json
+import os
+import threading
+import time
+import requests
+
+from metrics import metrics
+
+# Keeps METAR data fresh in the background so rendering never has to wait on the network.
+#   - one pooled requests.Session for every request
+#   - conditional requests with ETag / If-Modified-Since, a 304 costs no parsing at all
+#   - the last good response for each station is saved to disk and loaded on startup
+#   - stale data keeps being served while the background worker fetches new data, on_update is called
+#     when a new observation arrives so the display can show it straight away
+#   - responses for several stations are parsed in one streaming pass as they arrive, see iter_reports
+
+METAR_URL = "https://aviationweather.gov/api/data/metar"
+
+class MetarService():
+    def __init__(self, cache_path=None, base_url=METAR_URL, max_age=5 * 60, timeout=10, session=None, on_update=None):
+        self.cache_path = cache_path
+        self.base_url = base_url
+        self.max_age = max_age          # seconds before a station's data is fetched again
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.entries = {}               # station -> {"data", "observed", "etag", "last_modified", "fetched"}
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.thread = None
+        self.background = True          # Set False to never start the worker, e.g. in benchmarks
+        self.on_update = on_update      # Called with no arguments after a fetch brings a new observation
+        self.load()
+
+    # Load last good responses saved on disk
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path): return
+        try:
+            with open(self.cache_path, encoding="utf-8") as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError) as error:
+            print(f"METAR cache unreadable: {error}")
+
+    # Save responses to disk, written to a temporary file first so a crash can't leave half a file
+    def save(self):
+        if not self.cache_path: return
+        with self.lock:
+            text = json.dumps(self.entries)
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        temporary_path = self.cache_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temporary_path, self.cache_path)
+
+    # Fetch a station if it changed since the last request, returns True when a new observation arrived.
+    # Blocks on the network so only call it from the worker
+    def fetch(self, station):
+        with self.lock:
+            entry = dict(self.entries.get(station, {}))
+        headers = {}
+        if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+
+        with metrics.timer("weather_fetch", station=station):
+            response = self.session.get(self.base_url, params={"ids": station, "format": "json"}, headers=headers, timeout=self.timeout)
+        entry["fetched"] = time.time()
+        changed = False
+        if response.status_code != 304:
+            response.raise_for_status()
+            data = response.json() if response.content else []
+            observed = observation_time(data)
+            changed = observed != entry.get("observed") or not entry.get("data")
+            if changed:
+                entry["data"] = data
+                entry["observed"] = observed
+            entry["etag"] = response.headers.get("ETag")
+            entry["last_modified"] = response.headers.get("Last-Modified")
+        with self.lock:
+            self.entries[station] = entry
+        if changed: self.updated()
+        return changed
+
+    # Fetch several stations in one request if any changed since the last one, returns the stations with a new
+    # observation. The request's ETag is kept under the joined station names. Blocks on the network like fetch
+    def fetch_group(self, stations):
+        group = ",".join(stations)
+        with self.lock:
+            entry = dict(self.entries.get(group, {}))
+        headers = {}
+        if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+
+        changed = []
+        with metrics.timer("weather_fetch", station="multi"):
+            with self.session.get(self.base_url, params={"ids": group, "format": "json"}, headers=headers,
+                                  timeout=self.timeout, stream=True) as response:
+                if response.status_code != 304:
+                    response.raise_for_status()
+                    response.raw.decode_content = True
+                    reports = {}
+                    # Newest report comes first for each station, older ones are dropped as soon as they are parsed
+                    for report in iter_reports(response.raw):
+                        reports.setdefault(report.get("icaoId"), [report])
+        entry["fetched"] = time.time()
+        if response.status_code != 304:
+            with self.lock:
+                for station in stations:
+                    station_entry = dict(self.entries.get(station, {}), fetched=entry["fetched"])
+                    data = reports.get(station)
+                    if data and observation_time(data) != station_entry.get("observed"):
+                        station_entry["data"] = data
+                        station_entry["observed"] = observation_time(data)
+                        changed.append(station)
+                    self.entries[station] = station_entry
+            entry["etag"] = response.headers.get("ETag")
+            entry["last_modified"] = response.headers.get("Last-Modified")
+        with self.lock:
+            self.entries[group] = entry
+        if changed: self.updated()
+        return changed
+
+    # Save new observations and tell whoever is listening
+    def updated(self):
+        self.save()
+        if self.on_update: self.on_update()
+
+    # Latest data for a station, never blocks. Returns (data, observation time), (None, None) if never fetched
+    def latest(self, station):
+        with self.lock:
+            entry = self.entries.get(station, {})
+            return entry.get("data"), entry.get("observed")
+
+    # True when a station has no data or its data is older than max_age
+    def is_stale(self, station):
+        with self.lock:
+            entry = self.entries.get(station)
+            return entry is None or time.time() - entry.get("fetched", 0) >= self.max_age
+
+    # Seed a station's data without fetching it, e.g. from a snapshot or for testing
+    def put(self, station, data):
+        with self.lock:
+            self.entries[station] = {"data": data, "observed": observation_time(data), "fetched": time.time()}
+
+    # Start background worker running job every max_age seconds or whenever wake is called
+    def start(self, job):
+        if not self.background or self.thread is not None: return
+        def run():
+            # Runs until stop replaces the thread
+            while self.thread is threading.current_thread():
+                try:
+                    job()
+                except Exception as error:
+                    print(f"Weather update failed: {error}")
+                self.wake_event.wait(self.max_age)
+                self.wake_event.clear()
+        self.thread = threading.Thread(target=run, name="weather-service", daemon=True)
+        self.thread.start()
+
+    # Run the background job now instead of waiting for max_age
+    def wake(self):
+        self.wake_event.set()
+
+    # Stop the background worker once its current job finishes and close pooled connections
+    def stop(self):
+        self.thread = None
+        self.wake_event.set()
+        self.session.close()
+
+# Reports from a METAR json response one at a time as its bytes are read from stream, so a response for
+# many stations is never held whole as text or as a parsed list
+def iter_reports(stream, chunk_size=16 * 1024):
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer, position = "", 0
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer = buffer[position:] + text.decode(chunk or b"", final=not chunk)
+        position = 0
+        while True:
+            # Skip the array's brackets and the commas between reports
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]": position += 1
+            if position >= len(buffer): break
+            try:
+                report, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Report isn't complete yet, unless the response has ended
+                if not chunk: raise
+                break
+            yield report
+        if not chunk: return
+
+# Observation time for a METAR json response, used to tell if the weather actually changed
+def observation_time(data):
+    if not data: return None
+    report = data[0]
+    return report.get("obsTime") or report.get("reportTime") or report.get("rawOb")
@@ -0,0 +1,82 @@
+import json
+import os
+
+from playlist import Playlist
+from scheduler import DisplayScheduler
+
+# Panels driven by one dashboard process. Every panel has its own display, layout, playlist and
+# scheduler, plus its own display thread and pipeline so one panel's refresh never holds up another.
+# Layout modules, the frame store and the image library are shared between them, so panels showing
+# the same layout share its rendered frames and weather data.
+#
+# Panels are listed in a json file named by EPAPER_PANELS, e.g.
+#   [{"name": "hall", "min_sleep": 10},
+#    {"name": "kitchen", "device": 1, "dc_pin": 22, "busy_pin": 23, "rst_pin": 27, "layout": "weather"}]
+# Anything an entry leaves out comes from DEFAULT_PANEL, which matches the pins of a single panel HAT.
+
+# min_sleep is the shortest gap between updates the panel sleeps through, see power.py. Sleep is opt in, by
+# default panels stay awake so a clock's minute updates don't each pay for a reset and init
+DEFAULT_PANEL = {"name": "main", "bus": 0, "device": 0, "dc_pin": 25, "busy_pin": 24, "rst_pin": 17, "min_sleep": None}
+
+class Panel():
+    def __init__(self, name, display, snapshot_path):
+        self.name = name
+        self.display = display
+        self.snapshot_path = snapshot_path
+
+        # Display state, only changed by the panel's display thread when it handles scheduler events
+        self.layout = None
+        self.update_state = False
+        self.threshold = 128
+        self.dither = "threshold"   # How uploaded images are turned black and white, see dither.py
+        self.image = None           # Library key of the image this panel shows in the image layout
+        self.playlist = Playlist()  # Layouts and images shown in turn, takes over from layout while running
+        self.prefetched = None      # (playlist position, frame, wall clock time it goes stale) of the next entry
+        self.scheduler = DisplayScheduler()     # Web requests post events here to wake the display thread
+        self.job = None             # Newest web request job waiting to be rendered, see jobs.py
+
+        self.pipeline = None        # DisplayPipeline, made when the display thread starts
+        self.power = None           # PowerManager sleeping the display between updates, None keeps it awake
+        self.thread = None
+
+    # Layout on the display right now, the playlist's current entry while it runs
+    def showing_layout(self):
+        current = self.playlist.current()
+        return current[1]["layout"] if current else self.layout
+
+    # Panel state for the web page
+    def describe(self):
+        return {
+            "name": self.name,
+            "layout": self.layout,
+            "threshold": self.threshold,
+            "dither": self.dither,
+            "image": self.image,
+            "playlist": self.playlist.export_state(),
+            "pipeline": self.pipeline.stats() if self.pipeline else None,
+            "power": self.power.stats() if self.power else None,
+        }
+
+# Panel settings from a json file, a single default panel when no file is given
+def load_panel_config(path=None):
+    if not path: return [dict(DEFAULT_PANEL)]
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)
+    if not isinstance(entries, list) or not entries: raise ValueError(f"{path} must list at least one panel")
+
+    configs = []
+    for entry in entries:
+        config = dict(DEFAULT_PANEL, **entry)
+        if any(config["name"] == other["name"] for other in configs): raise ValueError(f"Panel name {config['name']} used twice")
+        for other in configs:
+            if (config["bus"], config["device"]) == (other["bus"], other["device"]): raise ValueError(f"Panels {other['name']} and {config['name']} share an SPI device")
+            shared = {config["dc_pin"], config["busy_pin"], config["rst_pin"]} & {other["dc_pin"], other["busy_pin"], other["rst_pin"]}
+            if shared: raise ValueError(f"Panels {other['name']} and {config['name']} share pins {sorted(shared)}")
+        configs.append(config)
+    return configs
+
+# Snapshot file for a panel, the first panel keeps the single panel snapshot path so upgrading resumes
+def panel_snapshot_path(snapshot_path, name, first):
+    if first: return snapshot_path
+    root, extension = os.path.splitext(snapshot_path)
+    return f"{root}-{name}{extension}"
@@ -0,0 +1,96 @@
+import threading
+
+# Two stage display pipeline. The producer (the display loop) renders and packs frames and hands them
+# to submit, which puts them in the back buffer. A worker thread owns the SPI bus, it sends the back
+# buffer to the display and then waits for BUSY to drop before taking the next one. Rendering the
+# next frame happens while the display is still refreshing, and if several frames arrive during a
+# refresh only the newest one is sent. With a power manager the worker also puts the display to sleep
+# when it has nothing to send and the next deadline is far enough away, and wakes it for the next frame.
+class DisplayPipeline():
+    def __init__(self, display, on_error=None, power=None, on_progress=None):
+        self.display = display
+        self.on_error = on_error        # Called with the exception when a refresh fails
+        self.on_progress = on_progress  # Called with (job, state, **info) as a submitted job's frame goes up
+        self.power = power              # PowerManager, None keeps the display awake
+        self.deadline = None            # Wall clock time the next frame is due, None when only events bring one
+        self.planned = False            # True once the producer has given a deadline, nothing sleeps before
+        self.condition = threading.Condition()
+        self.back = None                # Next (frame, refresh policy, job, on_sent) to send, None when nothing is waiting
+        self.sending = False            # True while the worker is sending or waiting on BUSY
+        self.last_result = None         # Result of the last display_frame call
+
+        # Counters
+        self.sent = 0
+        self.dropped = 0                # Frames replaced by a newer frame before they were sent
+
+        self.thread = threading.Thread(target=self.run, name=f"epaper-pipeline-{display.name}", daemon=True)
+        self.thread.start()
+
+    # Put frame in the back buffer, replacing any frame that hasn't been sent yet, whose job is cancelled.
+    # policy is the refresh policy to send it with, the display's own one when None, job is reported on
+    # and on_sent is called once the frame is on the display, never for a frame that was replaced or failed
+    def submit(self, frame, policy=None, job=None, on_sent=None):
+        with self.condition:
+            if self.back is not None:
+                self.dropped += 1
+                self.report(self.back[2], "cancelled", reason="superseded")
+            self.back = (frame, policy, job, on_sent)
+            self.condition.notify_all()
+
+    # Tell the worker when the next frame is due so it can sleep the display until then
+    def set_deadline(self, deadline):
+        with self.condition:
+            self.deadline = deadline
+            self.planned = True
+            self.condition.notify_all()
+
+    # True when the worker has nothing to send and the display should go to sleep
+    def sleep_due(self):
+        return self.power is not None and self.planned and self.back is None and self.power.should_sleep(self.deadline)
+
+    # Block until every submitted frame has been sent and the display is ready, or the timeout passes
+    def wait_idle(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.back is None and not self.sending, timeout)
+
+    # Worker thread, flips the back buffer to the display whenever the display is ready and sleeps the
+    # display when there is nothing to flip
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.back is not None or self.sleep_due())
+                (frame, policy, job, on_sent), self.back = self.back or (None, None, None, None), None
+                self.sending = True
+            try:
+                if frame is None:
+                    try:
+                        self.power.sleep()
+                    except Exception:
+                        # Retrying straight away would spin, wait for the producer's next deadline or frame
+                        with self.condition:
+                            self.planned = False
+                        raise
+                    continue
+                self.report(job, "transferring")
+                if self.power is not None: self.power.wake()
+                self.last_result = self.display.display_frame(frame, policy, progress=lambda stage: self.report(job, stage))
+                self.sent += 1
+                if on_sent: on_sent()
+                self.report(job, "done", result=self.last_result or "unchanged")
+            # Any failure, not just a BUSY timeout, fails the frame's job and the worker carries on with the next
+            except Exception as error:
+                self.report(job, "failed", error=str(error))
+                if self.on_error: self.on_error(error)
+            finally:
+                with self.condition:
+                    self.sending = False
+                    self.condition.notify_all()
+
+    # Pass a job's progress on, nothing to report for frames without a job
+    def report(self, job, state, **info):
+        if job is not None and self.on_progress is not None: self.on_progress(job, state, **info)
+
+    # Counters as a dict for reports
+    def stats(self):
+        with self.condition:
+            return {"sent": self.sent, "dropped": self.dropped, "pending": self.back is not None, "sending": self.sending}
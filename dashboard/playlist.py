@@ -0,0 +1,88 @@
+import threading
+import time
+
+# Ordered list of layouts and images shown one after another, each for its own dwell time.
+# Entries are dicts like:
+#   {"layout": "clock", "dwell": 60}
+#   {"layout": "image", "image": "<library key>", "threshold": 128, "dither": "atkinson", "dwell": 300}
+# Positions are (version, index) pairs, the version changes whenever the entries do so the display
+# thread can tell a frame it prepared earlier is for an entry that no longer exists.
+
+DEFAULT_DWELL = 60      # seconds an entry is shown when it doesn't give a dwell time
+MIN_DWELL = 5           # shortest dwell allowed, a full refresh takes about 4 seconds
+
+class Playlist():
+    def __init__(self):
+        self.entries = []
+        self.index = None       # Entry being shown, None until the playlist starts
+        self.started = None     # Wall clock time the current entry went up
+        self.running = False
+        self.version = 0
+        self.lock = threading.Lock()
+
+    # Replace every entry, the playlist starts again from the first one
+    def set(self, entries):
+        with self.lock:
+            self.entries = [dict(entry, dwell=max(MIN_DWELL, entry.get("dwell", DEFAULT_DWELL))) for entry in entries]
+            self.index = None
+            self.started = None
+            self.version += 1
+            if not self.entries: self.running = False
+
+    def start(self):
+        with self.lock:
+            self.running = bool(self.entries)
+            self.index = None
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+
+    # True when the current entry has been up for its dwell time, or nothing is up yet
+    def due(self, now):
+        with self.lock:
+            if not self.running: return False
+            return self.index is None or now >= self.started + self.entries[self.index]["dwell"]
+
+    # Move to the next entry, wrapping round to the first, returns its (position, entry)
+    def advance(self, now):
+        with self.lock:
+            self.index = 0 if self.index is None else (self.index + 1) % len(self.entries)
+            self.started = now
+            return (self.version, self.index), self.entries[self.index]
+
+    # (position, entry) being shown, None when stopped
+    def current(self):
+        with self.lock:
+            if not self.running or self.index is None: return None
+            return (self.version, self.index), self.entries[self.index]
+
+    # (position, entry) that will be shown next, None when stopped
+    def upcoming(self):
+        with self.lock:
+            if not self.running: return None
+            index = 0 if self.index is None else (self.index + 1) % len(self.entries)
+            return (self.version, index), self.entries[index]
+
+    # Wall clock time the current entry ends, None when stopped
+    def deadline(self):
+        with self.lock:
+            if not self.running: return None
+            if self.index is None: return time.time()
+            return self.started + self.entries[self.index]["dwell"]
+
+    # Playlist as plain data for the web page and the startup snapshot
+    def export_state(self):
+        with self.lock:
+            return {"entries": [dict(entry) for entry in self.entries], "running": self.running, "index": self.index}
+
+    # Restore from the startup snapshot, the entry that was showing gets a fresh dwell time since
+    # its frame is still on the display
+    def restore_state(self, state):
+        self.set(state.get("entries", []))
+        with self.lock:
+            self.running = state.get("running", False) and bool(self.entries)
+            index = state.get("index")
+            if self.running and index is not None and index < len(self.entries):
+                self.index = index
+                self.started = time.time()
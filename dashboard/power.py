@@ -0,0 +1,74 @@
+import threading
+import time
+
+from metrics import metrics
+
+# Puts a panel's controller into deep sleep between updates. The panel keeps its image without power,
+# so once a frame is up the controller only needs to be awake again for the next one. Sleeping keeps
+# SPI and GPIO open, waking is a reset and init that take as long as BUSY says and no longer.
+# Sleeping and waking cost time and power themselves, so the controller only sleeps when the next
+# deadline is at least min_sleep seconds away, or when only a web request can bring the next frame.
+# Wake, sleep and refresh times go to the metrics (stages "wake", "sleep" and "refresh") and stats().
+
+MIN_SLEEP = 10      # Shortest gap before a deadline worth sleeping through, in seconds
+
+class PowerManager():
+    def __init__(self, display, min_sleep=MIN_SLEEP):
+        self.display = display
+        self.min_sleep = min_sleep
+        self.lock = threading.Lock()
+
+        # Counters
+        self.sleeps = 0
+        self.wakes = 0
+        self.asleep_seconds = 0.0
+        self.slept_at = None            # When the controller went to sleep, None while it's awake
+        self.last_sleep_seconds = None  # How long the last sleep and wake took
+        self.last_wake_seconds = None
+
+    # True when the controller is awake and the next deadline, a wall clock time, is far enough away
+    def should_sleep(self, deadline):
+        if self.display.sleeping: return False
+        return deadline is None or deadline - time.time() >= self.min_sleep
+
+    # Power off and deep sleep the controller
+    def sleep(self):
+        if self.display.sleeping: return
+        start = time.perf_counter()
+        with metrics.timer("sleep", panel=self.display.name):
+            self.display.sleep()
+        with self.lock:
+            self.sleeps += 1
+            self.slept_at = time.monotonic()
+            self.last_sleep_seconds = time.perf_counter() - start
+
+    # Wake the controller if it is asleep, returns the seconds waking took
+    def wake(self):
+        if not self.display.sleeping: return 0.0
+        start = time.perf_counter()
+        with metrics.timer("wake", panel=self.display.name):
+            self.display.wake()
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.wakes += 1
+            if self.slept_at is not None:
+                slept = time.monotonic() - self.slept_at
+                self.asleep_seconds += slept
+                metrics.count("epaper_sleep_seconds_total", slept, "Seconds panel controllers spent in deep sleep", panel=self.display.name)
+            self.slept_at = None
+            self.last_wake_seconds = seconds
+        return seconds
+
+    # Counters as a dict for reports
+    def stats(self):
+        with self.lock:
+            asleep = self.asleep_seconds + (time.monotonic() - self.slept_at if self.slept_at is not None else 0)
+            return {
+                "asleep": self.display.sleeping,
+                "min_sleep": self.min_sleep,
+                "sleeps": self.sleeps,
+                "wakes": self.wakes,
+                "asleep_seconds": asleep,
+                "last_sleep_seconds": self.last_sleep_seconds,
+                "last_wake_seconds": self.last_wake_seconds,
+            }
@@ -0,0 +1,35 @@
+from collections import OrderedDict
+import io
+import threading
+
+from framebuffer import unpack_frame
+from framestore import frame_hash
+
+# PNG images of packed frames for viewing the panel from a browser. PNGs are cached by frame hash,
+# which doubles as the ETag, so a dashboard polling for the current frame only gets a 304 until the
+# frame changes and a frame is only ever encoded once.
+class PngCache():
+    def __init__(self, width=800, height=480, color_black=0xFF, max_images=16):
+        self.width = width
+        self.height = height
+        self.color_black = color_black
+        self.max_images = max_images
+        self.images = OrderedDict()     # frame hash -> png bytes, oldest first
+        self.lock = threading.Lock()
+
+    # (ETag, png bytes) for a packed frame
+    def get(self, frame):
+        digest = frame_hash(frame)
+        with self.lock:
+            png = self.images.get(digest)
+            if png is not None:
+                self.images.move_to_end(digest)
+                return digest, png
+
+        buffer = io.BytesIO()
+        unpack_frame(frame, self.width, self.height, self.color_black).save(buffer, "PNG", optimize=False)
+        png = buffer.getvalue()
+        with self.lock:
+            self.images[digest] = png
+            while len(self.images) > self.max_images: self.images.popitem(last=False)
+        return digest, png
@@ -0,0 +1,46 @@
+# Picks how each frame goes onto the panel. A clean full refresh uses the panel's own waveform and
+# flashes the whole screen, it takes about 4 seconds but clears all ghosting. Between clean refreshes
+# frames can go up as:
+#   partial - only the changed regions are refreshed
+#   fast    - the whole screen is refreshed with the fast waveform, about 1.5 seconds
+# and partial refreshes can use the fast waveform too, which gets small changes like the clock's minute
+# down to well under a second. Ghosting builds up with every update that isn't clean, so a clean full
+# refresh is forced after max_updates of them, after max_age seconds, or when more than max_fraction
+# of the screen changes.
+
+class RefreshPolicy():
+    def __init__(self, fast=False, partial=True, max_updates=10, max_age=None, max_fraction=0.25):
+        self.fast = fast                    # Use the fast waveform between clean refreshes
+        self.partial = partial              # Refresh only changed regions between clean refreshes
+        self.max_updates = max_updates      # Updates allowed before a clean refresh
+        self.max_age = max_age              # Seconds allowed since the last clean refresh, None for no limit
+        self.max_fraction = max_fraction    # Largest part of the screen an update may change, 0 makes every refresh clean
+
+    # "full", "partial" or "fast" for a frame changing changed_fraction of the screen
+    def choose(self, changed_fraction, updates, seconds_since_clean):
+        if changed_fraction > self.max_fraction or updates >= self.max_updates: return "full"
+        if self.max_age is not None and seconds_since_clean >= self.max_age: return "full"
+        if self.partial: return "partial"
+        return "fast" if self.fast else "full"
+
+    # Settings as a dict for the web page
+    def describe(self):
+        return {"fast": self.fast, "partial": self.partial, "max_updates": self.max_updates,
+                "max_age": self.max_age, "max_fraction": self.max_fraction}
+
+# Policies layouts can name in the layout manifest
+POLICIES = {
+    # Partial refreshes with the panel's waveform, a clean refresh every 10 updates
+    "default": RefreshPolicy(),
+    # Fast waveform partial refreshes for small frequent changes like the clock, cleaned every half hour
+    "fast": RefreshPolicy(fast=True, max_updates=30, max_age=30 * 60),
+    # Every refresh is clean, for photos where ghosting shows the most
+    "clean": RefreshPolicy(partial=False, max_fraction=0),
+}
+
+# Policy for a manifest entry's "refresh" setting, a policy name or a dict of RefreshPolicy settings
+def policy_from(setting):
+    if setting is None: return POLICIES["default"]
+    if isinstance(setting, dict): return RefreshPolicy(**setting)
+    if setting not in POLICIES: raise ValueError(f"Unknown refresh policy {setting}")
+    return POLICIES[setting]
@@ -0,0 +1,40 @@
+from collections import deque
+import threading
+import time
+
+# Wakes the display thread when an event is posted, e.g. from a web request, or when the next layout
+# deadline is reached, whichever comes first. Deadlines are wall clock times from time.time() so
+# layouts can line up with minute boundaries.
+class DisplayScheduler():
+    def __init__(self):
+        self.events = deque()
+        self.condition = threading.Condition()
+
+    # Queue event for the display thread and wake it straight away
+    def post(self, kind, **data):
+        with self.condition:
+            self.events.append((kind, data))
+            self.condition.notify_all()
+
+    # Block until an event is queued or the deadline passes, returns True when events are waiting
+    def wait(self, deadline=None):
+        with self.condition:
+            while not self.events:
+                if deadline is None:
+                    self.condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0: return False
+                self.condition.wait(remaining)
+            return True
+
+    # Take every queued event in the order they were posted
+    def drain(self):
+        with self.condition:
+            events = list(self.events)
+            self.events.clear()
+            return events
+
+# Next wall clock minute boundary after now, used by layouts that change once a minute
+def next_minute(now):
+    return (int(now) // 60 + 1) * 60
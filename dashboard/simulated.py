@@ -0,0 +1,189 @@
+from types import SimpleNamespace
+import time
+
+# Simulated e-paper panel used to run the display code without a Raspberry Pi. It stands in for
+# both spidev and RPi.GPIO, records every command and data byte sent, counts SPI and GPIO calls,
+# and holds the BUSY pin high for as long as the refresh model says the panel would be busy.
+
+# How long the panel stays busy after each command, scale speeds up or slows down every duration
+class RefreshModel():
+    def __init__(self, full=4.0, partial=0.6, power_on=0.1, power_off=0.05, fast=1.5, fast_partial=0.3, reset=0.01, scale=1.0):
+        self.durations = {"full": full, "partial": partial, "power_on": power_on, "power_off": power_off,
+                          "fast": fast, "fast_partial": fast_partial, "reset": reset}
+        self.scale = scale
+
+    def duration(self, kind):
+        return self.durations[kind] * self.scale
+
+# Fake RPi.GPIO module bound to a simulated panel
+class SimulatedGPIO():
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, panel):
+        self.panel = panel
+        self.levels = {}    # pin -> last output level
+
+    def setmode(self, mode):
+        self.panel.gpio_calls += 1
+
+    def setup(self, pin, direction, **kwargs):
+        self.panel.gpio_calls += 1
+
+    def output(self, pin, level):
+        self.panel.gpio_calls += 1
+        released = pin == self.panel.rst_pin and level == self.HIGH and self.levels.get(pin) == self.LOW
+        self.levels[pin] = level
+        if pin == self.panel.rst_pin and level == self.LOW: self.panel.reset()
+        if released: self.panel.start_busy("reset")     # Controller is busy starting up after a reset
+
+    def input(self, pin):
+        self.panel.gpio_calls += 1
+        if pin == self.panel.busy_pin: return self.HIGH if self.panel.is_busy() else self.LOW
+        return self.levels.get(pin, self.LOW)
+
+    # Sleep until BUSY drops or the timeout in milliseconds runs out, returns None on timeout like RPi.GPIO
+    def wait_for_edge(self, pin, edge, timeout=None):
+        self.panel.gpio_calls += 1
+        if pin != self.panel.busy_pin or edge != self.FALLING: raise ValueError("Simulated panel only has falling edges on BUSY")
+        limit = time.monotonic() + timeout / 1000 if timeout is not None else None
+        while self.panel.is_busy():
+            remaining = float("inf") if self.panel.stuck else self.panel.busy_until - time.monotonic()
+            if limit is not None: remaining = min(remaining, limit - time.monotonic())
+            if remaining == float("inf"): remaining = 1.0
+            if remaining <= 0: return None
+            time.sleep(remaining)
+        return pin
+
+    def cleanup(self, *pins):
+        self.panel.gpio_calls += 1
+        self.levels.clear()
+
+# Fake spidev.SpiDev bound to a simulated panel
+class SimulatedSpi():
+    def __init__(self, panel):
+        self.panel = panel
+        self.max_speed_hz = 500_000
+        self.mode = 0
+        self.bufsiz = 4096
+
+    def open(self, bus, device):
+        self.panel.spi_device = (bus, device)
+
+    def close(self):
+        self.panel.spi_device = None
+
+    # Same limit as the real spidev writebytes
+    def writebytes(self, data):
+        if len(data) > self.bufsiz: raise OverflowError(f"Argument list size exceeds {self.bufsiz} bytes.")
+        self.panel.receive(bytes(data), self.max_speed_hz)
+
+    # Real writebytes2 splits large buffers into bufsiz transfers, each one is a syscall
+    def writebytes2(self, data):
+        data = bytes(data)
+        for start in range(0, len(data), self.bufsiz):
+            self.panel.receive(data[start:start + self.bufsiz], self.max_speed_hz)
+
+class SimulatedPanel():
+    def __init__(self, dc_pin=25, busy_pin=24, rst_pin=17, refresh_model=None):
+        self.name = "simulated"
+        self.dc_pin = dc_pin
+        self.busy_pin = busy_pin
+        self.rst_pin = rst_pin
+        self.refresh_model = refresh_model or RefreshModel()
+
+        # Modules the display code uses in place of spidev and RPi.GPIO
+        self.GPIO = SimulatedGPIO(self)
+        self.spidev = SimpleNamespace(SpiDev=lambda: SimulatedSpi(self))
+        self.spi_device = None
+
+        self.busy_until = 0
+        self.busy_periods = []      # (kind, seconds) for every busy period started
+        self.partial_mode = False
+        self.fast_waveform = False  # Temperature fixed by 0xE0/0xE5, the controller uses its fast waveform
+        self.sleeping = False
+        self.stuck = False          # Set to hold BUSY high forever, for testing timeouts
+        self.ignored = 0            # Commands sent while in deep sleep, the controller never sees them
+        self.reset_counters()
+
+    # Clear everything recorded so far
+    def reset_counters(self):
+        self.commands = []          # [command, data bytes] in the order they were sent
+        self.spi_syscalls = 0
+        self.spi_bytes = 0
+        self.transfer_seconds = 0   # time the bytes sent would take on the wire at the spi clock
+        self.gpio_calls = 0
+
+    # Reset pin pulled low, panel leaves partial mode and deep sleep
+    def reset(self):
+        self.partial_mode = False
+        self.fast_waveform = False
+        self.sleeping = False
+        self.busy_until = 0
+
+    def is_busy(self):
+        return self.stuck or time.monotonic() < self.busy_until
+
+    # Start busy period for a kind of refresh model duration
+    def start_busy(self, kind):
+        duration = self.refresh_model.duration(kind)
+        self.busy_until = time.monotonic() + duration
+        self.busy_periods.append((kind, duration))
+
+    # Bytes arriving over SPI are commands while DC is low and data while DC is high
+    def receive(self, data, speed_hz):
+        self.spi_syscalls += 1
+        self.spi_bytes += len(data)
+        self.transfer_seconds += len(data) * 8 / speed_hz
+        if self.GPIO.levels.get(self.dc_pin, self.GPIO.LOW) == self.GPIO.LOW:
+            for command in data:
+                if self.sleeping:
+                    self.ignored += 1
+                    continue
+                self.commands.append([command, bytearray()])
+                self.run_command(command)
+        elif self.commands and not self.sleeping:
+            self.commands[-1][1].extend(data)
+            # Deep sleep starts once the check code arrives
+            if self.commands[-1][0] == 0x07 and self.commands[-1][1][:1] == b"\xa5": self.sleeping = True
+            if self.commands[-1][0] == 0xE0: self.fast_waveform = bool(self.commands[-1][1][0] & 0x02)
+
+    def run_command(self, command):
+        if command == 0x04: self.start_busy("power_on")
+        elif command == 0x02: self.start_busy("power_off")
+        elif command == 0x12: self.start_busy(self.refresh_kind())
+        elif command == 0x91: self.partial_mode = True
+        elif command == 0x92: self.partial_mode = False
+
+    # Refresh model duration a display refresh takes with the current mode and waveform
+    def refresh_kind(self):
+        if self.partial_mode: return "fast_partial" if self.fast_waveform else "partial"
+        return "fast" if self.fast_waveform else "full"
+
+    # Data sent with every use of a command
+    def data_for(self, command):
+        return [bytes(data) for sent, data in self.commands if sent == command]
+
+    # Last full frame written to the panel with 0x13 outside of partial mode
+    def last_frame(self, buffer_length=800 * 480 // 8):
+        for data in reversed(self.data_for(0x13)):
+            if len(data) == buffer_length: return data
+        return None
+
+    # Counters as a dict for reports
+    def stats(self):
+        return {
+            "commands": len(self.commands),
+            "spi_syscalls": self.spi_syscalls,
+            "spi_bytes": self.spi_bytes,
+            "transfer_seconds": self.transfer_seconds,
+            "gpio_calls": self.gpio_calls,
+            "ignored": self.ignored,
+        }
@@ -0,0 +1,37 @@
+import json
+import os
+import struct
+import time
+
+# Small snapshot of the dashboard's state saved after each frame, so a restart can pick up where it
+# left off without repainting the display or repeating network lookups. The file holds a json header
+# (layout, threshold, module state, when it was saved) followed by the packed frame on the display.
+
+MAGIC = b"EPSN"
+HEADER = struct.Struct("<4sI")      # magic, json length
+
+# Write snapshot, to a temporary file first so a crash never leaves half a snapshot behind
+def save_snapshot(path, state, frame):
+    state = dict(state, saved=time.time())
+    text = json.dumps(state).encode("utf-8")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(text)))
+        file.write(text)
+        file.write(frame or b"")
+    os.replace(temporary_path, path)
+
+# Read snapshot back as (state, frame), or (None, None) when there isn't a usable one
+def load_snapshot(path):
+    if not os.path.exists(path): return None, None
+    try:
+        with open(path, "rb") as file:
+            magic, length = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC: return None, None
+            state = json.loads(file.read(length).decode("utf-8"))
+            frame = file.read() or None
+    except (OSError, ValueError, struct.error) as error:
+        print(f"Snapshot unreadable: {error}")
+        return None, None
+    return state, frame
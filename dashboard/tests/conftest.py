@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Tests import modules from the dashboard folder the same way main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from epaper_display import EpaperDisplay
+from simulated import RefreshModel, SimulatedPanel
+
+# Initialized display on the simulated panel, busy periods are scaled down so refreshes take milliseconds
+@pytest.fixture
+def display():
+    display = EpaperDisplay(backend=SimulatedPanel(refresh_model=RefreshModel(scale=0.001)))
+    display.initalize_display()
+    return display
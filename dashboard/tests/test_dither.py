@@ -0,0 +1,25 @@
+from PIL import Image
+import numpy as np
+
+from dither import ATKINSON, FLOYD_STEINBERG, bayer_matrix, dither_image, error_diffusion, error_diffusion_reference
+from framebuffer import DITHER_MODES
+
+# Vectorized error diffusion gives the same pixels as the plain loop
+def test_error_diffusion_matches_reference():
+    random = np.random.default_rng(1)
+    small = random.integers(0, 256, (37, 53)).astype(np.int32)
+    for weights, shift in (FLOYD_STEINBERG, ATKINSON):
+        for level in (0, 60, 127, 200, 255):
+            assert np.array_equal(error_diffusion(small, level, weights, shift), error_diffusion_reference(small, level, weights, shift))
+
+def test_bayer_matrix():
+    assert bayer_matrix(8)[1, :4].tolist() == [48, 16, 56, 24]
+    assert sorted(bayer_matrix(4).ravel().tolist()) == list(range(16))
+
+# Every mode gives a black and white image of the size asked for
+def test_dither_modes():
+    gradient = Image.linear_gradient("L")
+    for mode in DITHER_MODES:
+        result = dither_image(gradient, mode, size=(80, 48))
+        assert result.size == (80, 48)
+        assert set(np.unique(np.asarray(result)).tolist()) <= {0, 255}
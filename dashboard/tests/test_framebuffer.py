@@ -0,0 +1,86 @@
+import os
+import random
+
+from PIL import Image, ImageOps
+import pytest
+
+from framebuffer import crop_frame, diff_regions, merge_regions, pack_image, pack_image_reference, unpack_frame
+
+WIDTH, HEIGHT = 160, 96
+
+@pytest.fixture
+def noise():
+    return Image.frombytes("L", (WIDTH, HEIGHT), os.urandom(WIDTH * HEIGHT))
+
+# Fast packing matches the reference for a mix of images and settings
+def test_pack_image_matches_reference(noise):
+    gradient = Image.linear_gradient("L").resize((WIDTH, HEIGHT))
+    photo = Image.merge("RGB", [noise, gradient, noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)])
+    bitmap = noise.convert("1")
+    for img in (noise, gradient, photo, bitmap):
+        for threshold in (0, 1, 64, 127, 128, 200, 255, 256, random.randint(0, 255)):
+            for invert in (False, True):
+                for color_black, color_white in ((0xFF, 0x00), (0x00, 0xFF)):
+                    settings = (WIDTH, HEIGHT, threshold, invert, color_black, color_white)
+                    fast = pack_image(img, *settings)
+                    assert fast == pack_image_reference(img, *settings), f"Mismatch for {img.mode} image with {settings}"
+                    assert pack_image(unpack_frame(fast, WIDTH, HEIGHT, color_black), WIDTH, HEIGHT, color_black=color_black, color_white=color_white) == fast
+
+# Diff regions cover every changed pixel and nothing outside them changed
+def test_diff_regions_cover_every_change(noise):
+    old = pack_image(noise, WIDTH, HEIGHT)
+    changed = noise.copy()
+    changed.paste(ImageOps.invert(noise.crop((10, 5, 43, 20))), (10, 5))
+    changed.paste(ImageOps.invert(noise.crop((100, 60, 104, 61))), (100, 60))
+    new = pack_image(changed, WIDTH, HEIGHT)
+
+    regions = diff_regions(old, new, WIDTH, HEIGHT)
+    assert regions == [(8, 5, 40, 15), (96, 60, 8, 1)]
+    patched = bytearray(old)
+    for x, y, region_width, region_height in regions:
+        crop = crop_frame(new, WIDTH, (x, y, region_width, region_height))
+        row_bytes = region_width // 8
+        for row in range(region_height):
+            start = (y + row) * (WIDTH // 8) + x // 8
+            patched[start:start + row_bytes] = crop[row * row_bytes:(row + 1) * row_bytes]
+    assert bytes(patched) == new
+    assert diff_regions(new, new, WIDTH, HEIGHT) == []
+
+def test_merge_regions():
+    regions = [(8, 5, 40, 15), (96, 60, 8, 1)]
+    assert merge_regions(regions) == [(8, 5, 96, 56)]
+    assert merge_regions(regions, 2) == regions
+    # The two regions closest together are merged first
+    assert merge_regions([(0, 0, 8, 8), (8, 0, 8, 8), (400, 400, 8, 8)], 2) == [(0, 0, 16, 8), (400, 400, 8, 8)]
+
+# Changes in several nearby places go up as a single partial window and refresh
+def test_partial_refresh_uses_one_window(display):
+    panel = display.backend
+    frame = bytes(display.buffer_length)
+    display.display_frame(frame)
+    changed = bytearray(frame)
+    changed[0] = changed[5] = changed[20 * 100 + 3] = 0xFF    # Rows 0 and 20 are separate regions
+    panel.reset_counters()
+    panel.busy_periods.clear()
+    assert display.display_frame(bytes(changed)) == "partial"
+    assert [kind for kind, seconds in panel.busy_periods] == ["partial"]
+    assert len(panel.data_for(0x90)) == 1
+    assert display.last_frame == bytes(changed)
+
+# Small changes in opposite corners make one window covering the whole screen, too much for a partial refresh
+def test_opposite_corners_refresh_in_full(display):
+    panel = display.backend
+    frame = bytes(display.buffer_length)
+    display.display_frame(frame)
+    changed = bytearray(frame)
+    changed[0] = changed[-1] = 0xFF
+    panel.busy_periods.clear()
+    assert display.display_frame(bytes(changed)) == "full"
+    assert [kind for kind, seconds in panel.busy_periods] == ["full"]
+
+    # With a window per corner both stay small
+    display.max_partial_windows = 2
+    changed[0] = changed[-1] = 0x0F
+    panel.reset_counters()
+    assert display.display_frame(bytes(changed)) == "partial"
+    assert len(panel.data_for(0x90)) == 2
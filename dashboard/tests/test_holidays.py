@@ -0,0 +1,43 @@
+import datetime
+import json
+
+from modules.clock.holidays import HolidayCalendar, load_calendar, load_rules, rule_date
+
+def test_next_holiday():
+    calendar = HolidayCalendar()
+    assert calendar.next_holiday(datetime.date(2024, 12, 25)) == ("Christmas Day", 0)
+    assert calendar.next_holiday(datetime.date(2024, 11, 1)) == ("Veterans Day", 10)
+    assert calendar.next_holiday(datetime.date(2024, 12, 26)) == ("New Year's Day", 6)
+
+def test_rule_dates():
+    assert rule_date({"name": "Thanksgiving", "month": 11, "weekday": 3, "nth": 4}, 2024) == datetime.date(2024, 11, 28)
+    assert rule_date({"name": "Memorial Day", "month": 5, "weekday": 0, "nth": -1}, 2024) == datetime.date(2024, 5, 27)
+    assert rule_date({"name": "Saturday", "month": 5, "day": 4, "observed": True}, 2024) == datetime.date(2024, 5, 3)
+    # Days a year doesn't have are left out instead of landing in another month
+    assert rule_date({"name": "Leap", "month": 2, "day": 29}, 2023) is None
+    assert rule_date({"name": "Fifth Monday", "month": 2, "weekday": 0, "nth": 5}, 2024) is None
+    assert rule_date({"name": "Fifth Thursday", "month": 2, "weekday": 3, "nth": 5}, 2024) == datetime.date(2024, 2, 29)
+
+# Rules that don't make sense are skipped when the file is loaded, the rest are kept
+def test_bad_rules_skipped(tmp_path, capsys):
+    path = tmp_path / "holidays.json"
+    path.write_text(json.dumps([
+        {"name": "Good", "month": 3, "day": 17},
+        {"name": "Month", "month": 13, "day": 1},
+        {"name": "Day", "month": 4, "day": 31},
+        {"name": "Weekday", "month": 1, "weekday": 7, "nth": 1},
+        {"name": "Nth", "month": 1, "weekday": 0, "nth": 0},
+        {"name": "Bool", "month": True, "day": 1},
+        {"month": 1, "day": 1},
+        {"name": "Neither", "month": 1},
+    ]))
+    assert [rule["name"] for rule in load_rules(str(path))] == ["Good"]
+    output = capsys.readouterr().out
+    assert "month must be 1 to 12" in output and "day must be 1 to 30 in month 4" in output
+    assert "weekday must be 0" in output and "nth must be 1 to 5" in output
+
+def test_unreadable_file_skipped(tmp_path):
+    path = tmp_path / "holidays.json"
+    path.write_text("{not json")
+    calendar = load_calendar([str(path)], include_default=False)
+    assert calendar.next_holiday(datetime.date(2024, 1, 1)) == (None, None)
@@ -0,0 +1,71 @@
+import json
+
+from jobs import JobTracker, format_event
+
+# Events from a stream as dicts, comments like keepalives are skipped
+def parse(chunk):
+    data = [line[len("data: "):] for line in chunk.splitlines() if line.startswith("data: ")]
+    return json.loads(data[0]) if data else None
+
+def test_states_and_final_states():
+    tracker = JobTracker()
+    job = tracker.create("main", "layout", layout="clock")
+    assert job.state == "queued" and job.detail == {"layout": "clock"}
+    tracker.update(job, "rendering")
+    tracker.update(job, "done", result="partial")
+    assert job.state == "done" and job.info == {"result": "partial"}
+    # Finished jobs stay finished
+    tracker.update(job, "failed", error="late")
+    assert job.state == "done"
+    assert set(job.times) == {"queued", "rendering", "done"}
+    assert tracker.get(job.id) is job
+    tracker.update(None, "done")
+
+def test_newest_per_panel():
+    tracker = JobTracker()
+    first = tracker.create("main", "layout")
+    other = tracker.create("kitchen", "layout")
+    second = tracker.create("main", "image")
+    assert not tracker.is_newest(first)
+    assert tracker.is_newest(second) and tracker.is_newest(other)
+
+def test_oldest_jobs_forgotten():
+    tracker = JobTracker(max_jobs=2)
+    first = tracker.create("main", "layout")
+    tracker.create("main", "layout")
+    tracker.create("main", "layout")
+    assert tracker.get(first.id) is None
+
+# Subscribers get every state change in order, a full subscriber queue never blocks an update
+def test_subscribers():
+    tracker = JobTracker(max_subscribers=1)
+    subscriber = tracker.subscribe()
+    assert tracker.subscribe() is None
+    job = tracker.create("main", "layout")
+    tracker.update(job, "rendering")
+    events = [subscriber.get_nowait() for _ in range(2)]
+    assert [event["state"] for event in events] == ["queued", "rendering"]
+    assert events[0]["event"] < events[1]["event"]
+
+    for _ in range(300): tracker.publish(job.describe())
+    tracker.unsubscribe(subscriber)
+    assert tracker.subscribe() is not None
+
+# A single job's stream starts with where the job is and ends when it finishes
+def test_job_stream():
+    tracker = JobTracker()
+    job = tracker.create("main", "layout")
+    other = tracker.create("kitchen", "layout")
+    subscriber = tracker.subscribe()
+    stream = tracker.stream(subscriber, job_id=job.id)
+    assert parse(next(stream))["state"] == "queued"
+    tracker.update(other, "rendering")
+    tracker.update(job, "done", result="full")
+    assert parse(next(stream))["state"] == "done"
+    assert list(stream) == []
+    assert subscriber not in tracker.subscribers
+
+def test_format_event():
+    text = format_event({"id": "abc", "state": "done", "event": 7})
+    assert text.startswith("id: 7\nevent: job\n") and text.endswith("\n\n")
+    assert parse(text)["state"] == "done"
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+import main
+from framestore import FrameStore
+from panels import DEFAULT_PANEL
+
+# Wait for condition to become true, panels run on their own threads
+def eventually(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end: return False
+        time.sleep(0.01)
+    return True
+
+# main.py's shared state pointed at a temporary folder, with simulated panels instead of the hardware
+@pytest.fixture
+def dashboard(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "HARDWARE_BACKEND", "simulated")
+    monkeypatch.setattr(main, "SNAPSHOT_PATH", str(tmp_path / "snapshot.bin"))
+    monkeypatch.setattr(main, "LIBRARY_PATH", str(tmp_path / "library"))
+    monkeypatch.setattr(main, "library", None)
+    monkeypatch.setattr(main, "panels", {})
+    monkeypatch.setattr(main, "frames", FrameStore())
+    monkeypatch.setattr(main, "fresh_frames", {})
+    monkeypatch.setattr(main, "latest_frames", {})
+    return main
+
+# Add and start a panel on its own simulated display, refreshes scaled down to milliseconds
+def start(dashboard, layout, **config):
+    display = dashboard.open_display(dict(DEFAULT_PANEL, **config))
+    display.backend.refresh_model.scale = 0.001
+    panel = dashboard.add_panel(config["name"], display)
+    dashboard.start_panel(panel, layout)
+    return panel
+
+# Two panels showing different layouts each keep their own frame, events and refreshes, one panel
+# stuck in a refresh doesn't hold up the other
+def test_panels_are_independent(dashboard):
+    hall = start(dashboard, "clock", name="hall")
+    kitchen = start(dashboard, "time", name="kitchen", device=1, dc_pin=22, busy_pin=23, rst_pin=27)
+    frames = dashboard.frames
+    assert eventually(lambda: hall.display.last_frame is not None and kitchen.display.last_frame is not None)
+    assert eventually(lambda: frames.showing("hall") == hall.display.last_frame and frames.showing("kitchen") == kitchen.display.last_frame)
+    assert hall.display.last_frame != kitchen.display.last_frame
+    assert hall.scheduler is not kitchen.scheduler and hall.pipeline is not kitchen.pipeline
+    assert hall.snapshot_path != kitchen.snapshot_path
+    hall_first, kitchen_first = hall.display.last_frame, kitchen.display.last_frame
+
+    # Hold the kitchen panel in its next refresh
+    release = threading.Event()
+    display_frame = kitchen.display.display_frame
+    def held(frame, policy=None, progress=None):
+        release.wait(5)
+        return display_frame(frame, policy, progress)
+    kitchen.display.display_frame = held
+
+    kitchen.scheduler.post("layout", layout="clock")
+    hall.scheduler.post("layout", layout="time")
+    assert eventually(lambda: kitchen.pipeline.sending)
+    assert eventually(lambda: hall.display.last_frame != hall_first and frames.showing("hall") == hall.display.last_frame)
+    assert (hall.layout, kitchen.layout) == ("time", "clock")
+    assert kitchen.display.last_frame == kitchen_first
+
+    release.set()
+    assert eventually(lambda: kitchen.display.last_frame != kitchen_first and frames.showing("kitchen") == kitchen.display.last_frame)
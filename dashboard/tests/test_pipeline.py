@@ -0,0 +1,126 @@
+import threading
+import time
+
+from jobs import JobTracker
+from pipeline import DisplayPipeline
+from power import PowerManager
+
+# Frame with a few bytes set so consecutive frames differ
+def make_frame(display, value):
+    frame = bytearray(display.buffer_length)
+    frame[:4] = bytes([value] * 4)
+    return bytes(frame)
+
+# Wait for condition to become true, the worker runs on its own thread
+def eventually(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end: return False
+        time.sleep(0.01)
+    return True
+
+def test_frame_is_sent(display):
+    tracker = JobTracker()
+    pipeline = DisplayPipeline(display, on_progress=tracker.update)
+    job = tracker.create("main", "layout")
+    sent = []
+    pipeline.submit(make_frame(display, 1), job=job, on_sent=lambda: sent.append(True))
+    assert pipeline.wait_idle(5)
+    assert display.last_frame == make_frame(display, 1)
+    assert job.state == "done" and job.info["result"] == "full"
+    assert sent == [True]
+    assert pipeline.stats() == {"sent": 1, "dropped": 0, "pending": False, "sending": False}
+
+# Frames submitted while the display is busy replace each other, only the newest is sent
+def test_newer_frame_replaces_waiting_one(display):
+    tracker = JobTracker()
+    release = threading.Event()
+    display_frame = display.display_frame
+    def held(frame, policy=None, progress=None):
+        release.wait(5)
+        return display_frame(frame, policy, progress)
+    display.display_frame = held
+
+    pipeline = DisplayPipeline(display, on_progress=tracker.update)
+    first, second, third = (tracker.create("main", "layout") for _ in range(3))
+    sent = []
+    pipeline.submit(make_frame(display, 1), job=first)
+    assert eventually(lambda: pipeline.sending)
+    pipeline.submit(make_frame(display, 2), job=second, on_sent=lambda: sent.append(2))
+    pipeline.submit(make_frame(display, 3), job=third, on_sent=lambda: sent.append(3))
+    release.set()
+    assert pipeline.wait_idle(5)
+    assert (first.state, second.state, third.state) == ("done", "cancelled", "done")
+    assert sent == [3]
+    assert display.last_frame == make_frame(display, 3)
+    assert pipeline.stats()["dropped"] == 1
+
+# Any error fails the frame's job and the worker carries on with the next frame
+def test_worker_survives_errors(display):
+    tracker = JobTracker()
+    errors = []
+    display_frame = display.display_frame
+    def broken_once(frame, policy=None, progress=None):
+        display.display_frame = display_frame
+        raise ValueError("broken")
+    display.display_frame = broken_once
+
+    pipeline = DisplayPipeline(display, on_error=errors.append, on_progress=tracker.update)
+    failed, sent = tracker.create("main", "layout"), tracker.create("main", "layout")
+    saved = []
+    pipeline.submit(make_frame(display, 1), job=failed, on_sent=lambda: saved.append(1))
+    assert pipeline.wait_idle(5)
+    assert failed.state == "failed" and failed.info["error"] == "broken"
+    assert [str(error) for error in errors] == ["broken"]
+    assert saved == []
+
+    pipeline.submit(make_frame(display, 2), job=sent)
+    assert pipeline.wait_idle(5)
+    assert sent.state == "done"
+    assert pipeline.thread.is_alive()
+
+# With a power manager the display sleeps while the next deadline is far away and wakes for the next frame
+def test_sleeps_between_frames(display):
+    power = PowerManager(display, min_sleep=10)
+    pipeline = DisplayPipeline(display, power=power)
+    pipeline.submit(make_frame(display, 1))
+    assert pipeline.wait_idle(5)
+    assert not display.sleeping     # Nothing sleeps before the producer gives a deadline
+
+    pipeline.set_deadline(time.time() + 60)
+    assert eventually(lambda: display.sleeping)
+    # The frame after it is due soon, so the display stays awake once it's sent
+    pipeline.set_deadline(time.time() + 2)
+    pipeline.submit(make_frame(display, 2))
+    assert pipeline.wait_idle(5)
+    assert not display.sleeping
+    assert display.last_frame == make_frame(display, 2)
+    stats = power.stats()
+    assert (stats["sleeps"], stats["wakes"]) == (1, 1)
+
+# A deadline closer than min_sleep keeps the display awake
+def test_stays_awake_for_close_deadline(display):
+    pipeline = DisplayPipeline(display, power=PowerManager(display, min_sleep=10))
+    pipeline.set_deadline(time.time() + 2)
+    time.sleep(0.1)
+    assert not display.sleeping
+
+# A failed sleep isn't retried until the producer gives the next deadline
+def test_failed_sleep_waits_for_next_deadline(display):
+    power = PowerManager(display, min_sleep=10)
+    attempts, errors = [], []
+    sleep = power.sleep
+    def broken():
+        attempts.append(True)
+        raise TimeoutError("still busy")
+    power.sleep = broken
+    pipeline = DisplayPipeline(display, power=power, on_error=errors.append)
+    pipeline.set_deadline(time.time() + 60)
+    time.sleep(0.2)
+    assert len(attempts) == 1
+    assert [str(error) for error in errors] == ["still busy"]
+    assert not display.sleeping
+
+    power.sleep = sleep
+    pipeline.set_deadline(time.time() + 60)
+    assert eventually(lambda: display.sleeping)
@@ -0,0 +1,37 @@
+import time
+
+from power import PowerManager
+
+def test_should_sleep(display):
+    power = PowerManager(display, min_sleep=10)
+    assert power.should_sleep(None)
+    assert power.should_sleep(time.time() + 60)
+    assert not power.should_sleep(time.time() + 5)
+    power.sleep()
+    assert not power.should_sleep(None)     # Already asleep
+
+# Sleeping powers the controller off, it ignores commands until a wake resets it
+def test_sleep_and_wake(display):
+    panel = display.backend
+    power = PowerManager(display, min_sleep=10)
+    assert power.wake() == 0.0
+    frame = bytes(display.buffer_length)
+    display.display_frame(frame)
+
+    power.sleep()
+    assert display.sleeping and panel.sleeping
+    assert panel.data_for(0x07)[-1] == b"\xa5"
+    panel.reset_counters()
+    display.cmd(0x12)
+    assert panel.ignored == 1
+    power.sleep()
+    assert power.stats()["sleeps"] == 1
+
+    assert power.wake() > 0
+    assert not display.sleeping and not panel.sleeping
+    # The panel still shows the last frame, so it is kept for partial refreshes
+    assert display.last_frame == frame
+    stats = power.stats()
+    assert (stats["sleeps"], stats["wakes"], stats["asleep"]) == (1, 1, False)
+    assert stats["asleep_seconds"] > 0
+    assert stats["last_wake_seconds"] is not None
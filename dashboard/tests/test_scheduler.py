@@ -0,0 +1,36 @@
+import threading
+import time
+
+from scheduler import DisplayScheduler, next_minute
+
+def test_wait_returns_at_deadline():
+    scheduler = DisplayScheduler()
+    start = time.monotonic()
+    assert scheduler.wait(time.time() + 0.05) is False
+    assert time.monotonic() - start >= 0.04
+    assert scheduler.wait(time.time() - 1) is False
+
+# A posted event wakes a waiting display thread straight away
+def test_post_wakes_waiter():
+    scheduler = DisplayScheduler()
+    woken = []
+    thread = threading.Thread(target=lambda: woken.append(scheduler.wait(time.time() + 5)))
+    thread.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    scheduler.post("layout", layout="clock")
+    thread.join(5)
+    assert woken == [True]
+    assert time.monotonic() - start < 1
+
+def test_drain_in_post_order():
+    scheduler = DisplayScheduler()
+    scheduler.post("layout", layout="clock")
+    scheduler.post("image", key="abc")
+    assert scheduler.wait() is True
+    assert scheduler.drain() == [("layout", {"layout": "clock"}), ("image", {"key": "abc"})]
+    assert scheduler.drain() == []
+
+def test_next_minute():
+    assert next_minute(120) == 180
+    assert next_minute(179.9) == 180
@@ -0,0 +1,92 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import os
+import threading
+
+import pytest
+
+from modules.weather.service import MetarService, iter_reports
+
+REPORTS = [
+    {"icaoId": "KSFO", "obsTime": 1760000000, "rawOb": "KSFO 171756Z 29012KT 10SM FEW008 18/12 A3001"},
+    {"icaoId": "KSFO", "obsTime": 1759996400, "rawOb": "KSFO 171656Z 28010KT 10SM FEW008 17/12 A3001"},
+    {"icaoId": "KOAK", "obsTime": 1760000100, "rawOb": "KOAK 171758Z 30008KT 10SM CLR 17/11 A3002"},
+]
+
+# aviationweather.gov stand in on localhost, answers 304 to requests that send back its ETag
+@pytest.fixture
+def stub():
+    seen = []
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            seen.append((self.path, self.headers.get("If-None-Match")))
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            ids = self.path.split("ids=")[1].split("&")[0].replace("%2C", ",").split(",")
+            body = json.dumps([report for report in REPORTS if report["icaoId"] in ids]).encode()
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/metar", seen
+    server.shutdown()
+
+# Conditional requests cost nothing when the data hasn't changed and the data survives a restart
+def test_fetch_conditional_and_disk_cache(stub, tmp_path):
+    url, seen = stub
+    cache_path = os.path.join(tmp_path, "metar.json")
+    service = MetarService(cache_path, base_url=url)
+    assert service.latest("KSFO") == (None, None)
+    assert service.is_stale("KSFO")
+    assert service.fetch("KSFO") is True
+    assert service.fetch("KSFO") is False
+    assert [etag for path, etag in seen] == [None, '"v1"']
+    assert not service.is_stale("KSFO")
+    assert MetarService(cache_path, base_url=url).latest("KSFO")[1] == 1760000000
+
+# One request fills every station, the newest report of each is kept
+def test_fetch_group(stub):
+    url, seen = stub
+    updates = []
+    service = MetarService(base_url=url, on_update=lambda: updates.append(True))
+    assert service.fetch_group(["KSFO", "KOAK", "KSJC"]) == ["KSFO", "KOAK"]
+    assert len(seen) == 1
+    assert updates == [True]
+    assert service.latest("KSFO")[1] == 1760000000
+    assert service.latest("KOAK")[1] == 1760000100
+    assert service.latest("KSJC") == (None, None)
+    assert not service.is_stale("KSJC")
+    assert service.fetch_group(["KSFO", "KOAK", "KSJC"]) == []
+    assert seen[1][1] == '"v1"'
+    assert updates == [True]    # Nothing new, nobody is told
+
+# The background worker runs its job when woken and stops when asked
+def test_worker(stub):
+    url, seen = stub
+    service = MetarService(base_url=url)
+    fetched = threading.Event()
+    service.start(lambda: fetched.set() if service.fetch("KSFO") else None)
+    assert fetched.wait(5)
+    service.stop()
+    assert service.latest("KSFO")[1] == 1760000000
+
+# Reports come out one at a time however the response is split into reads, multi-byte characters included
+def test_iter_reports_streams_multi_station_payload():
+    reports = REPORTS + [{"icaoId": "LFPG", "rawOb": "LFPG 171800Z 24008KT CAVOK 14/08 Q1021 NOSIG", "remarks": ["été", {"nested": [1, 2]}]}]
+    payload = json.dumps(reports, indent=1, ensure_ascii=False).encode("utf-8")
+    for chunk_size in (1, 7, 64, len(payload)):
+        assert list(iter_reports(io.BytesIO(payload), chunk_size)) == reports
+    assert list(iter_reports(io.BytesIO(b""))) == []
+    assert list(iter_reports(io.BytesIO(b"[]"))) == []
+    with pytest.raises(ValueError):
+        list(iter_reports(io.BytesIO(payload[:-10]), 16))
@@ -0,0 +1,64 @@
+from metrics import metrics
+
+# Sends commands and their data to the display over SPI. The DC pin is only changed once per
+# command and once per data phase, then the whole data phase is written in one burst.
+
+# Largest single spidev transfer when the kernel parameter can't be read
+DEFAULT_CHUNK_SIZE = 4096
+
+# Read the spidev buffer size so chunks never get rejected by the kernel driver
+def spidev_buffer_size():
+    try:
+        with open("/sys/module/spidev/parameters/bufsiz") as file:
+            return int(file.read().strip())
+    except (OSError, ValueError):
+        return DEFAULT_CHUNK_SIZE
+
+class SpiTransport():
+    def __init__(self, spi, gpio, dc_pin, chunk_size=None):
+        self.spi = spi
+        self.gpio = gpio
+        self.DC_pin = dc_pin
+        self.chunk_size = chunk_size or spidev_buffer_size()
+        self.dc_state = None
+
+    # Only touch the DC pin when the level actually needs to change
+    def set_dc(self, state):
+        if self.dc_state != state:
+            self.gpio.output(self.DC_pin, state)
+            self.dc_state = state
+
+    # Send command byte, followed by its data payload if it has one
+    def command(self, command, data=None):
+        self.set_dc(self.gpio.LOW)
+        self.spi.writebytes([command])
+        metrics.count("epaper_spi_bytes_total", 1, "Bytes written to the display over SPI")
+        metrics.count("epaper_spi_syscalls_total", 1, "SPI write calls into the kernel")
+        if data: self.data(data)
+
+    # Send a data payload in as few transfers as possible
+    def data(self, data):
+        self.set_dc(self.gpio.HIGH)
+        data = bytes(data)
+        # Frame data and command parameters are timed apart so the few byte parameters don't hide the frames
+        with metrics.timer("spi", payload="frame" if len(data) >= 1024 else "parameters"):
+            # writebytes2 takes buffers of any size and splits them up inside spidev
+            if hasattr(self.spi, "writebytes2"):
+                self.spi.writebytes2(data)
+            else:
+                for start in range(0, len(data), self.chunk_size):
+                    self.spi.writebytes(list(data[start:start + self.chunk_size]))
+        metrics.count("epaper_spi_bytes_total", len(data))
+        metrics.count("epaper_spi_syscalls_total", -(-len(data) // self.chunk_size))
+
+    # Forget the DC level, used after the GPIO pins get reset
+    def reset(self):
+        self.dc_state = None
+
+# Open SPI device with the settings the display needs
+def open_spi(spidev, bus=0, device=0, speed_hz=2_000_000):
+    spi = spidev.SpiDev()
+    spi.open(bus, device)
+    spi.max_speed_hz = speed_hz
+    spi.mode = 0b00
+    return spi